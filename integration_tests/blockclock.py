@@ -0,0 +1,153 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+
+from websockets.sync.client import connect
+
+
+class BlockClock:
+    """
+    the latest block height of a node, pushed by one `newHeads` subscription
+    on the json-rpc websocket, the waiters are woken up on the exact block,
+    and fall back to polling with the `poll` function they provide.
+    """
+
+    def __init__(self, ws_url, poll_interval=0.5, idle_interval=2):
+        self.ws_url = ws_url
+        self.poll_interval = poll_interval
+        self.idle_interval = idle_interval
+        self.cond = threading.Condition()
+        self.height = 0
+        self.connected = False
+        self.waiters = 0
+        self.async_waiters = set()
+        self.thread = None
+
+    def start(self):
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                with connect(self.ws_url) as ws:
+                    ws.send(
+                        json.dumps(
+                            {
+                                "jsonrpc": "2.0",
+                                "id": 1,
+                                "method": "eth_subscribe",
+                                "params": ["newHeads"],
+                            }
+                        )
+                    )
+                    for msg in ws:
+                        head = (json.loads(msg).get("params") or {}).get("result")
+                        if isinstance(head, dict) and "number" in head:
+                            self.connected = True
+                            self.update(int(head["number"], 16))
+            except Exception:
+                pass
+            with self.cond:
+                self.connected = False
+                # the node is stopped or restarted, the height is stale.
+                self.height = 0
+                if not self.waiters and not self.async_waiters:
+                    self.thread = None
+                    return
+            time.sleep(self.poll_interval)
+
+    @property
+    def interval(self):
+        "the waiters only poll occasionally when the subscription is alive"
+        return self.idle_interval if self.connected else self.poll_interval
+
+    def update(self, height):
+        with self.cond:
+            self.height = height
+            self.cond.notify_all()
+            for loop, event in self.async_waiters:
+                loop.call_soon_threadsafe(event.set)
+
+    def poll(self, fn):
+        try:
+            self.update(fn())
+        except Exception as e:
+            print(f"poll block height failed: {e}", file=sys.stderr)
+
+    async def poll_async(self, fn):
+        try:
+            self.update(await fn())
+        except Exception as e:
+            print(f"poll block height failed: {e}", file=sys.stderr)
+
+    def wait(self, height, poll, timeout=120):
+        "wait until the block height reaches `height`, return the current height"
+        self.start()
+        self.poll(poll)
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            self.waiters += 1
+        try:
+            while True:
+                with self.cond:
+                    if self.height >= height:
+                        return self.height
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"wait for block {height} timeout")
+                    if self.cond.wait(min(self.interval, remaining)):
+                        continue
+                self.poll(poll)
+        finally:
+            with self.cond:
+                self.waiters -= 1
+
+    async def wait_async(self, height, poll, timeout=120):
+        "the asyncio version of `wait`, `poll` is a coroutine function"
+        self.start()
+        await self.poll_async(poll)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            event = asyncio.Event()
+            with self.cond:
+                if self.height >= height:
+                    return self.height
+                self.async_waiters.add((loop, event))
+            try:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"wait for block {height} timeout")
+                try:
+                    await asyncio.wait_for(event.wait(), min(self.interval, remaining))
+                except asyncio.TimeoutError:
+                    await self.poll_async(poll)
+            finally:
+                with self.cond:
+                    self.async_waiters.discard((loop, event))
+
+
+# node endpoint -> BlockClock, registered by the local clusters
+CLOCKS = {}
+CLOCKS_LOCK = threading.Lock()
+
+
+def register_block_clock(ws_url, *endpoints):
+    "share the clock of the websocket endpoint with the node's other endpoints"
+    with CLOCKS_LOCK:
+        clock = CLOCKS.get(ws_url)
+        if clock is None:
+            clock = CLOCKS[ws_url] = BlockClock(ws_url)
+        for endpoint in endpoints:
+            CLOCKS[endpoint] = clock
+        return clock
+
+
+def block_clock(endpoint):
+    "the clock of the endpoint, None for the unknown nodes"
+    return CLOCKS.get(endpoint)
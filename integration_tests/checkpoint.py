@@ -0,0 +1,26 @@
+import os
+import shutil
+
+# the table files of goleveldb and rocksdb are never modified once written,
+# so the snapshots can share them with the node by hardlinks.
+IMMUTABLE_SUFFIXES = (".ldb", ".sst")
+
+
+def copy_file(src, dst):
+    if src.endswith(IMMUTABLE_SUFFIXES):
+        try:
+            os.link(src, dst)
+            return dst
+        except OSError:
+            # e.g. across filesystems
+            pass
+    return shutil.copy2(src, dst)
+
+
+def snapshot(src, dst):
+    """
+    copy the directory, the immutable db files are hardlinked,
+    the others (wal, manifest, priv_validator_state.json, etc.) are copied.
+    """
+    shutil.rmtree(dst, ignore_errors=True)
+    shutil.copytree(src, dst, symlinks=True, copy_function=copy_file)
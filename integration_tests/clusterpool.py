@@ -0,0 +1,120 @@
+import json
+import tempfile
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+from .network import expand_config, setup_custom_mantra
+
+
+class ClusterPool:
+    """
+    the running clusters of the session keyed by the expanded config,
+    the modules asking for an equivalent config share one cluster,
+    which is stopped once the last of them is done, the prefetched ones
+    never acquired are stopped at the end of the session.
+    """
+
+    def __init__(self, base_dir):
+        self.base_dir = Path(base_dir)
+        self.lock = threading.Lock()
+        # key -> future of (setup generator, cluster)
+        self.clusters = {}
+        # future -> number of the fixtures using the cluster
+        self.refs = {}
+
+    def key(self, config, chain=None, **kwargs):
+        data = expand_config(config, chain)
+        return json.dumps([data, chain, kwargs], sort_keys=True, default=str)
+
+    def mktemp(self, name):
+        return Path(tempfile.mkdtemp(prefix=f"{name}-", dir=self.base_dir))
+
+    def start(self, fut, name, base_port, config, **kwargs):
+        try:
+            gen = setup_custom_mantra(self.mktemp(name), base_port, config, **kwargs)
+            cluster = next(gen)
+        except BaseException as e:
+            with self.lock:
+                if not fut.cancelled():
+                    fut.set_exception(e)
+            return
+        with self.lock:
+            cancelled = fut.cancelled()
+            if not cancelled:
+                fut.set_result((gen, cluster))
+        if cancelled:
+            # the pool is closed while booting
+            gen.close()
+
+    def submit(self, name, base_port, config, background=False, ref=False, **kwargs):
+        """
+        the future of the shared cluster, booted in a thread if `background`,
+        `ref` counts a user of the cluster, to be released afterwards.
+        """
+        key = self.key(config, **kwargs)
+        with self.lock:
+            fut = self.clusters.get(key)
+            if fut is None:
+                fut = self.clusters[key] = Future()
+                started = False
+            else:
+                started = True
+            if ref:
+                self.refs[fut] = self.refs.get(fut, 0) + 1
+        if started:
+            return fut
+        args = (fut, name, base_port, config)
+        if background:
+            # not a daemon, so the cluster booted after the session is stopped
+            threading.Thread(target=self.start, args=args, kwargs=kwargs).start()
+        else:
+            self.start(*args, **kwargs)
+        return fut
+
+    def prefetch(self, name, base_port, config, **kwargs):
+        "boot the cluster in background, for the fixtures asking for it later"
+        return self.submit(name, base_port, config, background=True, **kwargs)
+
+    def acquire(self, name, base_port, config, exclusive=False, **kwargs):
+        """
+        yield a running cluster of the config for a fixture,
+        `exclusive` starts a private one for the modules mutating the chain,
+        e.g. the global params, so are the ones customized with `post_init`.
+        """
+        if exclusive or kwargs.get("post_init") is not None:
+            yield from setup_custom_mantra(
+                self.mktemp(name), base_port, config, **kwargs
+            )
+            return
+        fut = self.submit(name, base_port, config, ref=True, **kwargs)
+        try:
+            _, cluster = fut.result()
+            yield cluster
+        finally:
+            self.release(fut)
+
+    def release(self, fut):
+        "stop the shared cluster once its last user is done"
+        with self.lock:
+            self.refs[fut] -= 1
+            if self.refs[fut] > 0:
+                return
+            del self.refs[fut]
+            self.clusters = {k: v for k, v in self.clusters.items() if v is not fut}
+        if fut.exception() is None:
+            gen, _ = fut.result()
+            gen.close()
+
+    def close(self):
+        "stop the running clusters, the ones still booting stop once booted"
+        with self.lock:
+            futs = list(self.clusters.values())
+            self.clusters.clear()
+            self.refs.clear()
+            # the booting ones are cancelled, their boot thread stops them
+            running = [fut for fut in futs if not fut.cancel()]
+        for fut in reversed(running):
+            if fut.exception() is None:
+                gen, _ = fut.result()
+                gen.close()
@@ -1,10 +1,24 @@
+import contextlib
+import getpass
+import tempfile
+import threading
+import time
+from pathlib import Path
+
 import pytest
+from _pytest.mark.expression import Expression
 
+from . import teardown, timing
+from .clusterpool import ClusterPool
 from .network import (
+    MANTRA_CONFIG,
     connect_custom_mantra,
+    connect_local_mantra,
     setup_geth,
-    setup_mantra,
 )
+from .utils import precompile_contracts
+
+POOL_KEY = pytest.StashKey[ClusterPool]()
 
 
 def pytest_addoption(parser):
@@ -16,9 +30,31 @@ def pytest_addoption(parser):
         required=False,
         help="Specify chain config to test",
     )
+    parser.addoption(
+        "--timing-report",
+        default=None,
+        action="store",
+        metavar="PATH",
+        help="write the wall time breakdown of the tests to the json file",
+    )
+    parser.addoption(
+        "--prefetch",
+        default=False,
+        action="store_true",
+        help="boot the session cluster and build the contracts in background "
+        "at session start, overlapping with the collection",
+    )
+    parser.addoption(
+        "--prune-on-failure",
+        default=False,
+        action="store_true",
+        help="remove the data dirs of the clusters stopped after a test failed, "
+        "they are kept for troubleshooting by default",
+    )
 
 
 def pytest_configure(config):
+    teardown.STATE["prune_on_failure"] = config.getoption("prune_on_failure")
     config.addinivalue_line("markers", "unmarked: fallback mark for unmarked tests")
     config.addinivalue_line("markers", "slow: marks tests as slow")
     config.addinivalue_line("markers", "asyncio: marks tests as asyncio")
@@ -26,6 +62,74 @@ def pytest_configure(config):
     config.addinivalue_line("markers", "skipped: marks skipped not supported tests")
 
 
+def cluster_base_dir(config):
+    """
+    the dir of the pooled clusters, next to the numbered temp dirs of pytest,
+    where the debug files of a failed CI run are collected from.
+    """
+    if config.option.basetemp:
+        root = Path(config.option.basetemp).resolve().parent
+    else:
+        try:
+            user = getpass.getuser()
+        except (OSError, KeyError):
+            user = "unknown"
+        root = Path(tempfile.gettempdir()) / f"pytest-of-{user}"
+    root.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return tempfile.mkdtemp(prefix="clusters-", dir=root)
+
+
+def pytest_sessionstart(session):
+    config = session.config
+    pool = config.stash[POOL_KEY] = ClusterPool(cluster_base_dir(config))
+    if not config.getoption("prefetch"):
+        return
+    if config.getoption("numprocesses", None) and not hasattr(config, "workerinput"):
+        # the xdist controller runs no tests
+        return
+    chain = config.getoption("chain_config")
+    pool.prefetch("mantra", 26650, MANTRA_CONFIG, chain=chain)
+    threading.Thread(target=precompile_contracts, daemon=True).start()
+
+
+def pytest_sessionfinish(session):
+    "stop the pooled clusters, including the prefetched ones never used"
+    pool = session.config.stash.get(POOL_KEY, None)
+    if pool is not None:
+        pool.close()
+    teardown.join()
+    if pool is not None:
+        # unless the data dirs are kept
+        with contextlib.suppress(OSError):
+            pool.base_dir.rmdir()
+
+
+def pytest_runtest_logreport(report):
+    if report.failed:
+        teardown.STATE["failed"] = True
+
+
+def connect_requested(config):
+    "the connect tests are selected explicitly, to run against an external node"
+    keywordexpr = config.option.keyword
+    markexpr = config.option.markexpr
+    # evaluated for a test marked `connect`, e.g. `-m "not connect"` is false
+    return bool(
+        (
+            keywordexpr
+            and Expression.compile(keywordexpr).evaluate(
+                lambda name, **_: name.lower() in "connect"
+            )
+        )
+        or (
+            markexpr
+            and Expression.compile(markexpr).evaluate(
+                lambda name, **_: name == "connect"
+            )
+        )
+    )
+
+
 def pytest_collection_modifyitems(items, config):
     keywordexpr = config.option.keyword
     markexpr = config.option.markexpr
@@ -37,15 +141,12 @@ def pytest_collection_modifyitems(items, config):
 
     for item in items:
         # add "unmarked" marker to tests that have no markers
-        if not any(item.iter_markers()):
+        if not any(m.name != "usefixtures" for m in item.iter_markers()):
             item.add_marker("unmarked")
 
         # skip connect-marked tests unless explicitly requested
         if "connect" in item.keywords:
-            if not (
-                (keywordexpr and "connect" in keywordexpr)
-                or (markexpr and "connect" in markexpr)
-            ):
+            if not connect_requested(config):
                 item.add_marker(skip_connect)
 
         if "skipped" in item.keywords:
@@ -56,6 +157,31 @@ def pytest_collection_modifyitems(items, config):
                 item.add_marker(skip_rollback)
 
 
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    timing.begin_test(item.nodeid)
+    start = time.perf_counter()
+    yield
+    timing.end_test(item.nodeid, time.perf_counter() - start)
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    data = timing.report()
+    if not data["tests"]:
+        return
+    terminalreporter.write_sep("=", "wall time breakdown (seconds)")
+    for line in timing.summary_lines(data):
+        terminalreporter.write_line(line)
+    data["latency"] = timing.latency_report()
+    terminalreporter.write_sep("=", "call latency (milliseconds)")
+    for line in timing.latency_lines(data["latency"]):
+        terminalreporter.write_line(line)
+    path = config.getoption("timing_report")
+    if path:
+        timing.write_report(path, data)
+        terminalreporter.write_line(f"wall time breakdown is written to {path}")
+
+
 @pytest.fixture(scope="session")
 def suspend_capture(pytestconfig):
     """
@@ -83,16 +209,38 @@ def suspend_capture(pytestconfig):
     yield SuspendGuard()
 
 
+@pytest.fixture(scope="session")
+def cluster_pool(pytestconfig):
+    "the clusters shared by the modules with equivalent configs"
+    return pytestconfig.stash[POOL_KEY]
+
+
 @pytest.fixture(scope="session", params=[True])
-def mantra(request, tmp_path_factory):
+def mantra(request, cluster_pool):
     chain = request.config.getoption("chain_config")
-    path = tmp_path_factory.mktemp("mantra")
-    yield from setup_mantra(path, 26650, chain)
+    yield from cluster_pool.acquire("mantra", 26650, MANTRA_CONFIG, chain=chain)
+
+
+@pytest.fixture(scope="module")
+def isolated_mantra(request, mantra):
+    "rewind the session cluster after the module, e.g. one passing gov proposals"
+    name = request.module.__name__
+    mantra.checkpoint(name)
+    yield mantra
+    mantra.restore(name)
+    mantra.drop_checkpoint(name)
 
 
 @pytest.fixture(scope="session", params=[True])
-def connect_mantra():
-    yield from connect_custom_mantra()
+def connect_mantra(request):
+    """
+    the external node of the connect tests, otherwise the session cluster,
+    whose ports are leased and may differ from the defaults of connect mode.
+    """
+    if connect_requested(request.config):
+        yield from connect_custom_mantra()
+    else:
+        yield connect_local_mantra(request.getfixturevalue("mantra"))
 
 
 @pytest.fixture(scope="session")
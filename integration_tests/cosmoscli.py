@@ -1,29 +1,137 @@
+import asyncio
+import copy
+import functools
 import json
+import re
+import shlex
 import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import requests
 from pystarport.utils import build_cli_args_safe, interact, parse_amount
 
+from .cosmosrest import PARAMS_PATHS, SESSION, CosmosREST
+from .timing import cli_call
+from .txstream import tx_response, tx_stream
 from .utils import (
+    ACCOUNTS,
+    ADDRESS_PREFIX,
     DEFAULT_DENOM,
     DEFAULT_GAS,
     DEFAULT_GAS_PRICE,
     MNEMONICS,
+    eth_to_bech32,
     get_sync_info,
 )
 
+BECH32_PREFIXES = {
+    "acc": ADDRESS_PREFIX,
+    "val": f"{ADDRESS_PREFIX}valoper",
+    "cons": f"{ADDRESS_PREFIX}valcons",
+}
+
+# (home, name, bech, field) -> resolved key address
+ADDRESSES = {}
+
+CHAIN_ID_PATTERN = re.compile(rb'"chain_id"\s*:\s*"([^"]*)"')
+
+
+@functools.lru_cache(maxsize=4)
+def load_genesis(path, mtime_ns):
+    "parse the genesis file, cached by path and modification time"
+    return json.loads(Path(path).read_bytes())
+
+
+@functools.lru_cache(maxsize=64)
+def genesis_chain_id(path, mtime_ns, chunk_size=65536):
+    """
+    scan the chain_id from the head of the genesis file, cached by path and
+    modification time like `load_genesis`, the chain_id is before the big
+    app_state normally, otherwise parse the whole file.
+    """
+    head = b""
+    with open(path, "rb") as fp:
+        while chunk := fp.read(chunk_size):
+            head += chunk
+            end = head.find(b'"app_state"')
+            m = CHAIN_ID_PATTERN.search(head, 0, end if end >= 0 else len(head))
+            if m:
+                return json.loads(b'"' + m.group(1) + b'"')
+            if end >= 0:
+                break
+    return load_genesis(path, mtime_ns)["chain_id"]
+
+
+class SearchedTx(dict):
+    """
+    the raw /tx_search result, only converted to the cli's tx result shape,
+    with the decoded tx and the block time, when `response` is accessed.
+    """
+
+    def __init__(self, data, cli):
+        super().__init__(data)
+        self.cli = cli
+
+    @functools.cached_property
+    def response(self):
+        return tx_response(
+            self["hash"],
+            self["height"],
+            self["tx_result"],
+            tx=self.get("tx"),
+            timestamp=tx_stream(self.cli.node_rpc_http).block_time(self["height"]),
+        ).with_decoder(self.cli.decode_tx)
+
 
 class ChainCommand:
     def __init__(self, cmd):
         self.cmd = cmd
 
+    @cli_call
     def __call__(self, cmd, *args, stdin=None, stderr=subprocess.STDOUT, **kwargs):
         "execute mantrachaind"
         args = " ".join(build_cli_args_safe(cmd, *args, **kwargs))
         return interact(f"{self.cmd} {args}", input=stdin, stderr=stderr)
 
 
+class AsyncChainCommand:
+    def __init__(self, cmd, semaphore):
+        self.cmd = cmd
+        self.semaphore = semaphore
+
+    @cli_call
+    async def __call__(
+        self, cmd, *args, stdin=None, stderr=subprocess.STDOUT, **kwargs
+    ):
+        "execute mantrachaind without blocking the event loop"
+        args = shlex.split(" ".join(build_cli_args_safe(cmd, *args, **kwargs)))
+        async with self.semaphore:
+            proc = await asyncio.create_subprocess_exec(
+                *shlex.split(self.cmd),
+                *args,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+            )
+            stdout, _ = await proc.communicate(input=stdin)
+        assert proc.returncode == 0, f'{stdout.decode("utf-8")} ({self.cmd} {args})'
+        return stdout
+
+
+class BlockingChainCommand:
+    "run the commands of a sync CosmosCLI in a worker thread on the event loop"
+
+    def __init__(self, command, loop):
+        self.command = command
+        self.loop = loop
+
+    def __call__(self, *args, **kwargs):
+        fut = asyncio.run_coroutine_threadsafe(self.command(*args, **kwargs), self.loop)
+        return fut.result()
+
+
 class CosmosCLI:
     "the apis to interact with wallet and blockchain"
 
@@ -33,15 +141,16 @@ class CosmosCLI:
         node_rpc,
         cmd,
         chain_id=None,
+        api=None,
     ):
         self.data_dir = data_dir
         genesis_path = self.data_dir / "config" / "genesis.json"
         self.raw = ChainCommand(cmd)
         if genesis_path.exists():
-            self._genesis = json.loads(genesis_path.read_text())
-            self.chain_id = self._genesis["chain_id"]
+            self.chain_id = genesis_chain_id(
+                str(genesis_path), genesis_path.stat().st_mtime_ns
+            )
         else:
-            self._genesis = {}
             self.chain_id = chain_id
             # avoid client.yml overwrite flag in textual mode
             self.raw(
@@ -49,6 +158,8 @@ class CosmosCLI:
             )
             self.raw("config", "set", "client", "node", node_rpc, home=self.data_dir)
         self.node_rpc = node_rpc
+        # answer the common queries with the rest gateway instead of the cli
+        self.rest = CosmosREST(api) if api else None
         self.output = None
         self.error = None
 
@@ -71,17 +182,26 @@ class CosmosCLI:
         return cls(data_dir, node_rpc, cmd)
 
     def validators(self):
+        if self.rest is not None:
+            return self.rest.validators()
         return json.loads(
             self.raw("q", "staking", "validators", output="json", node=self.node_rpc)
         )["validators"]
 
     def status(self):
-        return json.loads(self.raw("status", node=self.node_rpc))
+        "query /status with the shared http session, fallback to the cli"
+        try:
+            rsp = SESSION.get(f"{self.node_rpc_http}/status", timeout=5)
+            return rsp.json()["result"]
+        except (requests.RequestException, ValueError, KeyError):
+            return json.loads(self.raw("status", node=self.node_rpc))
 
     def block_height(self):
         return int(get_sync_info(self.status())["latest_block_height"])
 
     def balances(self, addr, height=0, **kwargs):
+        if self.rest is not None and not kwargs:
+            return self.rest.balances(addr, height=height)
         return json.loads(
             self.raw(
                 "q",
@@ -101,6 +221,29 @@ class CosmosCLI:
         return denoms.get(denom, 0)
 
     def address(self, name, bech="acc", field="address", skip_create=False):
+        key = (str(self.data_dir), name, bech, field)
+        if key not in ADDRESSES:
+            addr = self.local_address(name, bech, field)
+            if addr is None:
+                addr = self.keyring_address(name, bech, field, skip_create)
+            ADDRESSES[key] = addr
+        return ADDRESSES[key]
+
+    def local_address(self, name, bech="acc", field="address"):
+        """
+        resolve the address of the known mnemonics in process,
+        only when the node's keyring do hold that key,
+        e.g. the "validator" key is different on each node.
+        """
+        if field != "address" or bech not in BECH32_PREFIXES or name not in ACCOUNTS:
+            return None
+        eth_addr = ACCOUNTS[name].address
+        keyring = self.data_dir / "keyring-test"
+        if not (keyring / f"{eth_addr[2:].lower()}.address").exists():
+            return None
+        return eth_to_bech32(eth_addr, BECH32_PREFIXES[bech])
+
+    def keyring_address(self, name, bech="acc", field="address", skip_create=False):
         try:
             output = self.raw(
                 "keys",
@@ -143,6 +286,8 @@ class CosmosCLI:
         return eth_addr
 
     def account(self, addr, **kwargs):
+        if self.rest is not None and not kwargs:
+            return self.rest.account(addr)
         return json.loads(
             self.raw("q", "auth", "account", addr, **(self.get_base_kwargs() | kwargs))
         )
@@ -175,7 +320,25 @@ class CosmosCLI:
             rsp = self.event_query_tx_for(rsp["txhash"])
         return rsp
 
-    def event_query_tx_for(self, hash, **kwargs):
+    def event_query_tx_for(self, hash, timeout=15, **kwargs):
+        """
+        wait for the tx with the node's shared websocket subscription,
+        the other nodes and options are left to the cli.
+        """
+        if kwargs.get("node") == self.node_rpc:
+            kwargs.pop("node")
+        if kwargs:
+            return self.event_query_tx_for_cli(hash, **kwargs)
+        rsp = tx_stream(self.node_rpc_http).wait(hash, timeout=timeout)
+        return rsp.with_decoder(self.decode_tx)
+
+    def decode_tx(self, tx):
+        "decode the base64 tx bytes to the `tx` of the cli's tx results"
+        return {"@type": "/cosmos.tx.v1beta1.Tx"} | json.loads(
+            self.raw("tx", "decode", tx)
+        )
+
+    def event_query_tx_for_cli(self, hash, **kwargs):
         return json.loads(
             self.raw(
                 "q",
@@ -211,6 +374,8 @@ class CosmosCLI:
             self.raw("tx", "broadcast", tx_file, node=self.node_rpc, **kwargs)
         )
         if rsp.get("code") == 0:
+            kwargs.pop("broadcast_mode")
+            kwargs.pop("output")
             rsp = self.event_query_tx_for(rsp["txhash"], **kwargs)
         return rsp
 
@@ -247,6 +412,8 @@ class CosmosCLI:
 
     def create_account(self, name, mnemonic=None, **kwargs):
         "create new keypair in node's keyring"
+        for key in [key for key in ADDRESSES if key[1] == name]:
+            del ADDRESSES[key]
         if kwargs.get("coin_type", 60) == 60:
             kwargs.update({"coin_type": 60, "key_type": "eth_secp256k1"})
         default_kwargs = self.get_kwargs()
@@ -322,6 +489,8 @@ class CosmosCLI:
         return res
 
     def query_proposal(self, proposal_id, **kwargs):
+        if self.rest is not None and not kwargs:
+            return self.rest.query_proposal(proposal_id)
         res = json.loads(
             self.raw(
                 "q",
@@ -345,9 +514,12 @@ class CosmosCLI:
         return res.get("proposals") or res
 
     def staking_pool(self, bonded=True, **kwargs):
-        res = self.raw("q", "staking", "pool", **(self.get_base_kwargs() | kwargs))
-        res = json.loads(res)
-        res = res.get("pool") or res
+        if self.rest is not None and not kwargs:
+            res = self.rest.staking_pool()
+        else:
+            res = self.raw("q", "staking", "pool", **(self.get_base_kwargs() | kwargs))
+            res = json.loads(res)
+            res = res.get("pool") or res
         return int(res["bonded_tokens" if bonded else "not_bonded_tokens"])
 
     def delegate_amount(self, validator_address, amt, generate_only=False, **kwargs):
@@ -431,6 +603,8 @@ class CosmosCLI:
         return rsp
 
     def delegation(self, del_addr, val_addr, **kwargs):
+        if self.rest is not None and not kwargs:
+            return self.rest.delegation(del_addr, val_addr)
         try:
             res = json.loads(
                 self.raw(
@@ -486,6 +660,8 @@ class CosmosCLI:
         return rsp
 
     def validator(self, addr, **kwargs):
+        if self.rest is not None and not kwargs:
+            return self.rest.validator(addr)
         res = json.loads(
             self.raw(
                 "q",
@@ -509,6 +685,8 @@ class CosmosCLI:
         )
 
     def query_tally(self, proposal_id, **kwargs):
+        if self.rest is not None and not kwargs:
+            return self.rest.query_tally(proposal_id)
         res = json.loads(
             self.raw(
                 "q",
@@ -644,6 +822,8 @@ class CosmosCLI:
         return rsp
 
     def get_params(self, module, **kwargs):
+        if self.rest is not None and not kwargs and module in PARAMS_PATHS:
+            return self.rest.get_params(module)
         default_kwargs = self.get_base_kwargs()
         return json.loads(self.raw("q", module, "params", **(default_kwargs | kwargs)))
 
@@ -720,14 +900,45 @@ class CosmosCLI:
         )
 
     def tx_search_rpc(self, events: str):
-        rsp = requests.get(
+        return list(self.iter_tx_search(events))
+
+    def tx_search_page(self, events: str, page=1, per_page=100, order_by="asc"):
+        rsp = SESSION.get(
             f"{self.node_rpc_http}/tx_search",
             params={
                 "query": f'"{events}"',
+                "page": page,
+                "per_page": per_page,
+                "order_by": f'"{order_by}"',
             },
+            timeout=30,
         ).json()
         assert "error" not in rsp, rsp["error"]
-        return rsp["result"]["txs"]
+        return rsp["result"]
+
+    def iter_tx_search(self, events: str, per_page=100, order_by="asc", prefetch=2):
+        """
+        iterate all the matched txs page by page,
+        the next pages are fetched in background while the current one is consumed,
+        the pending fetches are dropped when the caller stops early,
+        the txs are yielded raw, and decoded by their `response` on demand.
+        """
+        first = self.tx_search_page(events, 1, per_page, order_by)
+        pages = -(-int(first["total_count"]) // per_page)
+        executor = ThreadPoolExecutor(max(prefetch, 1))
+        futs = {}
+        try:
+            for page in range(1, pages + 1):
+                for n in range(page + 1, min(page + max(prefetch, 1), pages) + 1):
+                    if n not in futs:
+                        futs[n] = executor.submit(
+                            self.tx_search_page, events, n, per_page, order_by
+                        )
+                result = first if page == 1 else futs.pop(page).result()
+                for tx in result["txs"]:
+                    yield SearchedTx(tx, self)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
     def query_erc20_token_pair(self, token, **kwargs):
         return json.loads(
@@ -804,6 +1015,8 @@ class CosmosCLI:
         return rsp
 
     def query_bank_denom_metadata(self, denom, **kwargs):
+        if self.rest is not None and not kwargs:
+            return self.rest.query_bank_denom_metadata(denom)
         return json.loads(
             self.raw(
                 "q",
@@ -1252,3 +1465,37 @@ class CosmosCLI:
         if rsp["code"] == 0:
             rsp = self.event_query_tx_for(rsp["txhash"])
         return rsp
+
+
+class AsyncCosmosCLI:
+    """
+    the asyncio mirror of CosmosCLI, every method returns a coroutine.
+
+    the commands are executed by `asyncio.create_subprocess_exec`, at most
+    `concurrency` of them at a time, share the `semaphore` to bound the
+    concurrency across nodes.
+
+    the methods still run the sync CosmosCLI code in the worker threads,
+    `concurrency` of them per instance, rather than the default executor,
+    whose size would otherwise cap the concurrency below the semaphore.
+    """
+
+    def __init__(self, cli: CosmosCLI, concurrency=8, semaphore=None):
+        self.cli = cli
+        self.semaphore = semaphore or asyncio.Semaphore(concurrency)
+        self.raw = AsyncChainCommand(cli.raw.cmd, self.semaphore)
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix="cli")
+
+    def __getattr__(self, name):
+        attr = getattr(self.cli, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            cli = copy.copy(self.cli)
+            cli.raw = BlockingChainCommand(self.raw, loop)
+            call = functools.partial(getattr(cli, name), *args, **kwargs)
+            return await loop.run_in_executor(self.executor, call)
+
+        return method
@@ -0,0 +1,145 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+# one pooled session shared by all the in-process query clients
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=64))
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=64))
+
+# module -> rest gateway path of the params query,
+# modules missing here are answered by the cli.
+PARAMS_PATHS = {
+    "auth": "/cosmos/auth/v1beta1/params",
+    "bank": "/cosmos/bank/v1beta1/params",
+    "consensus": "/cosmos/consensus/v1/params",
+    "distribution": "/cosmos/distribution/v1beta1/params",
+    "erc20": "/cosmos/evm/erc20/v1/params",
+    "evm": "/cosmos/evm/vm/v1/params",
+    "feemarket": "/cosmos/evm/feemarket/v1/params",
+    "mint": "/cosmos/mint/v1beta1/params",
+    "slashing": "/cosmos/slashing/v1beta1/params",
+    "staking": "/cosmos/staking/v1beta1/params",
+    "tokenfactory": "/osmosis/tokenfactory/v1beta1/params",
+}
+
+
+class QueryError(Exception):
+    "non-success response of the rest gateway"
+
+    def __init__(self, status, body):
+        super().__init__(f"{status}: {body}")
+        self.status = status
+        self.body = body
+
+
+def omitempty(obj):
+    """
+    drop the default values the same way as the cli's amino json output,
+    so the results can be compared with the cli ones directly.
+    """
+    if isinstance(obj, dict):
+        res = {}
+        for k, v in obj.items():
+            v = omitempty(v)
+            if v is None or v is False or v == "" or v == [] or v == {}:
+                continue
+            if type(v) is int and v == 0:
+                continue
+            res[k] = v
+        return res
+    if isinstance(obj, list):
+        return [omitempty(v) for v in obj]
+    return obj
+
+
+def any_to_amino(obj):
+    "convert the `@type` style Any to the `type`/`value` style used by the cli"
+    if isinstance(obj, dict):
+        if "@type" in obj:
+            value = {k: any_to_amino(v) for k, v in obj.items() if k != "@type"}
+            return {"type": obj["@type"], "value": value}
+        return {k: any_to_amino(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [any_to_amino(v) for v in obj]
+    return obj
+
+
+def normalize(obj):
+    "the amino json shape of the cli output"
+    return omitempty(any_to_amino(obj))
+
+
+class CosmosREST:
+    """
+    answer the common queries with pooled http calls to the rest gateway,
+    the results have the same shape as the corresponding `CosmosCLI` methods.
+    """
+
+    def __init__(self, url, session=SESSION, timeout=30):
+        self.url = url.rstrip("/")
+        self.session = session
+        self.timeout = timeout
+
+    def get(self, path, height=0, **params):
+        headers = {}
+        if height:
+            headers["x-cosmos-block-height"] = str(height)
+        rsp = self.session.get(
+            f"{self.url}{path}",
+            params={k: v for k, v in params.items() if v is not None},
+            headers=headers,
+            timeout=self.timeout,
+        )
+        if rsp.status_code != 200:
+            raise QueryError(rsp.status_code, rsp.text)
+        return rsp.json()
+
+    def balances(self, addr, height=0):
+        res = self.get(f"/cosmos/bank/v1beta1/balances/{addr}", height=height)
+        return normalize(res.get("balances", []))
+
+    def account(self, addr):
+        res = self.get(f"/cosmos/auth/v1beta1/accounts/{addr}")
+        return normalize(res)
+
+    def validator(self, addr):
+        res = self.get(f"/cosmos/staking/v1beta1/validators/{addr}")
+        return normalize(res.get("validator") or res)
+
+    def validators(self):
+        res = self.get(
+            "/cosmos/staking/v1beta1/validators", **{"pagination.limit": 1000}
+        )
+        return normalize(res["validators"])
+
+    def delegation(self, del_addr, val_addr):
+        try:
+            res = self.get(
+                f"/cosmos/staking/v1beta1/validators/{val_addr}/delegations/{del_addr}"
+            )
+        except QueryError as e:
+            if "delegation with delegator" in e.body and "not found" in e.body:
+                return {"balance": {"amount": 0}}
+            raise
+        return normalize(res.get("delegation_response") or res)
+
+    def staking_pool(self):
+        res = self.get("/cosmos/staking/v1beta1/pool")
+        return normalize(res.get("pool") or res)
+
+    def query_proposal(self, proposal_id):
+        res = self.get(f"/cosmos/gov/v1/proposals/{proposal_id}")
+        return normalize(res.get("proposal") or res)
+
+    def query_tally(self, proposal_id):
+        res = self.get(f"/cosmos/gov/v1/proposals/{proposal_id}/tally")
+        return normalize(res.get("tally") or res)
+
+    def get_params(self, module):
+        return normalize(self.get(PARAMS_PATHS[module]))
+
+    def query_bank_denom_metadata(self, denom):
+        res = self.get(
+            "/cosmos/bank/v1beta1/denoms_metadata_by_query_string", denom=denom
+        )
+        return normalize(res).get("metadata")
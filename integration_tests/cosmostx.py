@@ -0,0 +1,520 @@
+import base64
+import math
+import re
+import threading
+import weakref
+
+from cprotobuf import Field, ProtoEntity
+from eth_keys import keys
+from eth_utils import keccak
+
+from .cosmosrest import SESSION
+from .utils import (
+    DEFAULT_DENOM,
+    DEFAULT_GAS,
+    DEFAULT_GAS_AMT,
+    KEYS,
+    eth_to_bech32,
+)
+
+SIGN_MODE_DIRECT = 1
+ERR_WRONG_SEQUENCE = 32
+ETH_SECP256K1_PUBKEY = "/cosmos.evm.crypto.v1.ethsecp256k1.PubKey"
+
+
+class Any(ProtoEntity):
+    type_url = Field("string", 1)
+    value = Field("bytes", 2)
+
+
+class Coin(ProtoEntity):
+    denom = Field("string", 1)
+    amount = Field("string", 2)
+
+
+class PubKey(ProtoEntity):
+    key = Field("bytes", 1)
+
+
+class TxBody(ProtoEntity):
+    messages = Field(Any, 1, repeated=True)
+    memo = Field("string", 2)
+    timeout_height = Field("uint64", 3)
+
+
+class ModeInfoSingle(ProtoEntity):
+    mode = Field("int32", 1)
+
+
+class ModeInfo(ProtoEntity):
+    single = Field(ModeInfoSingle, 1)
+
+
+class SignerInfo(ProtoEntity):
+    public_key = Field(Any, 1)
+    mode_info = Field(ModeInfo, 2)
+    sequence = Field("uint64", 3)
+
+
+class Fee(ProtoEntity):
+    amount = Field(Coin, 1, repeated=True)
+    gas_limit = Field("uint64", 2)
+    payer = Field("string", 3)
+    granter = Field("string", 4)
+
+
+class AuthInfo(ProtoEntity):
+    signer_infos = Field(SignerInfo, 1, repeated=True)
+    fee = Field(Fee, 2)
+
+
+class SignDoc(ProtoEntity):
+    body_bytes = Field("bytes", 1)
+    auth_info_bytes = Field("bytes", 2)
+    chain_id = Field("string", 3)
+    account_number = Field("uint64", 4)
+
+
+class TxRaw(ProtoEntity):
+    body_bytes = Field("bytes", 1)
+    auth_info_bytes = Field("bytes", 2)
+    signatures = Field("bytes", 3, repeated=True)
+
+
+class BaseAccount(ProtoEntity):
+    address = Field("string", 1)
+    pub_key = Field(Any, 2)
+    account_number = Field("uint64", 3)
+    sequence = Field("uint64", 4)
+
+
+class BaseVestingAccount(ProtoEntity):
+    base_account = Field(BaseAccount, 1)
+
+
+class VestingAccount(ProtoEntity):
+    "the common prefix of all the vesting account types"
+
+    base_vesting_account = Field(BaseVestingAccount, 1)
+
+
+class QueryAccountRequest(ProtoEntity):
+    address = Field("string", 1)
+
+
+class QueryAccountResponse(ProtoEntity):
+    account = Field(Any, 1)
+
+
+class MsgSend(ProtoEntity):
+    TYPE_URL = "/cosmos.bank.v1beta1.MsgSend"
+    from_address = Field("string", 1)
+    to_address = Field("string", 2)
+    amount = Field(Coin, 3, repeated=True)
+
+
+class MsgDelegate(ProtoEntity):
+    TYPE_URL = "/cosmos.staking.v1beta1.MsgDelegate"
+    delegator_address = Field("string", 1)
+    validator_address = Field("string", 2)
+    amount = Field(Coin, 3)
+
+
+class MsgUndelegate(ProtoEntity):
+    TYPE_URL = "/cosmos.staking.v1beta1.MsgUndelegate"
+    delegator_address = Field("string", 1)
+    validator_address = Field("string", 2)
+    amount = Field(Coin, 3)
+
+
+class MsgBeginRedelegate(ProtoEntity):
+    TYPE_URL = "/cosmos.staking.v1beta1.MsgBeginRedelegate"
+    delegator_address = Field("string", 1)
+    validator_src_address = Field("string", 2)
+    validator_dst_address = Field("string", 3)
+    amount = Field(Coin, 4)
+
+
+class MsgWithdrawDelegatorReward(ProtoEntity):
+    TYPE_URL = "/cosmos.distribution.v1beta1.MsgWithdrawDelegatorReward"
+    delegator_address = Field("string", 1)
+    validator_address = Field("string", 2)
+
+
+class MsgWithdrawValidatorCommission(ProtoEntity):
+    TYPE_URL = "/cosmos.distribution.v1beta1.MsgWithdrawValidatorCommission"
+    validator_address = Field("string", 1)
+
+
+class MsgSetWithdrawAddress(ProtoEntity):
+    TYPE_URL = "/cosmos.distribution.v1beta1.MsgSetWithdrawAddress"
+    delegator_address = Field("string", 1)
+    withdraw_address = Field("string", 2)
+
+
+class MsgFundCommunityPool(ProtoEntity):
+    TYPE_URL = "/cosmos.distribution.v1beta1.MsgFundCommunityPool"
+    amount = Field(Coin, 1, repeated=True)
+    depositor = Field("string", 2)
+
+
+class MsgCreateDenom(ProtoEntity):
+    TYPE_URL = "/osmosis.tokenfactory.v1beta1.MsgCreateDenom"
+    sender = Field("string", 1)
+    subdenom = Field("string", 2)
+
+
+class MsgMint(ProtoEntity):
+    TYPE_URL = "/osmosis.tokenfactory.v1beta1.MsgMint"
+    sender = Field("string", 1)
+    amount = Field(Coin, 2)
+    mintToAddress = Field("string", 3)
+
+
+class MsgBurn(ProtoEntity):
+    TYPE_URL = "/osmosis.tokenfactory.v1beta1.MsgBurn"
+    sender = Field("string", 1)
+    amount = Field(Coin, 2)
+    burnFromAddress = Field("string", 3)
+
+
+class MsgChangeAdmin(ProtoEntity):
+    TYPE_URL = "/osmosis.tokenfactory.v1beta1.MsgChangeAdmin"
+    sender = Field("string", 1)
+    denom = Field("string", 2)
+    new_admin = Field("string", 3)
+
+
+def new(cls, **kwargs):
+    """
+    construct the message with the default values left out,
+    so the encoding is the same as the go side, which matters for the sign doc.
+    """
+    return cls(**{k: v for k, v in kwargs.items() if v})
+
+
+def pack(msg):
+    return new(Any, type_url=msg.TYPE_URL, value=bytes(msg.SerializeToString()))
+
+
+def parse_coins(coins):
+    "parse `100uom,2atoken` into a list of `Coin`"
+    res = []
+    for coin in coins.split(","):
+        m = re.match(r"^(\d+)(\S+)$", coin.strip())
+        assert m, f"invalid coin: {coin}"
+        res.append(new(Coin, denom=m.group(2), amount=m.group(1)))
+    return res
+
+
+class Signer:
+    "eth_secp256k1 key used to sign cosmos txs"
+
+    def __init__(self, key):
+        self.key = keys.PrivateKey(bytes(key))
+        self.address = eth_to_bech32(self.key.public_key.to_checksum_address())
+
+    def public_key(self):
+        pubkey = new(PubKey, key=self.key.public_key.to_compressed_bytes())
+        return new(
+            Any,
+            type_url=ETH_SECP256K1_PUBKEY,
+            value=bytes(pubkey.SerializeToString()),
+        )
+
+    def sign(self, data):
+        return self.key.sign_msg_hash(keccak(data)).to_bytes()
+
+
+# the live sequence managers, resynced when the chain state is rewound
+SEQUENCE_MANAGERS = weakref.WeakSet()
+
+
+def reset_sequences():
+    "resync all the accounts at next use, e.g. after restoring a checkpoint"
+    for manager in list(SEQUENCE_MANAGERS):
+        manager.reset()
+
+
+class SequenceManager:
+    """
+    hand out the account sequences locally, so one account can broadcast
+    many txs without waiting for each of them to be included,
+    the account is read from chain at first use and after `reset`.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.lock = threading.Lock()
+        self.accounts = {}
+        SEQUENCE_MANAGERS.add(self)
+
+    def next(self, addr):
+        "return account number and the next sequence to use"
+        with self.lock:
+            if addr not in self.accounts:
+                self.accounts[addr] = list(self.query(addr))
+            acct = self.accounts[addr]
+            acct[1] += 1
+            return acct[0], acct[1] - 1
+
+    def account_number(self, addr):
+        with self.lock:
+            if addr not in self.accounts:
+                self.accounts[addr] = list(self.query(addr))
+            return self.accounts[addr][0]
+
+    def reset(self, addr=None, sequence=None):
+        """
+        continue with the sequence if known,
+        otherwise resync the account at next use, all of them if addr is None.
+        """
+        with self.lock:
+            if addr is None:
+                self.accounts.clear()
+            elif sequence is not None and addr in self.accounts:
+                self.accounts[addr][1] = sequence
+            else:
+                self.accounts.pop(addr, None)
+
+
+class CosmosTxBuilder:
+    """
+    build, sign and broadcast cosmos txs in process,
+    the signers are the keys in `utils.KEYS` (eth_secp256k1, coin type 60).
+    """
+
+    def __init__(
+        self,
+        cli,
+        gas=DEFAULT_GAS,
+        gas_price=DEFAULT_GAS_AMT,
+        denom=DEFAULT_DENOM,
+        timeout=30,
+    ):
+        self.cli = cli
+        self.chain_id = cli.chain_id
+        self.rpc = cli.node_rpc_http
+        self.gas = gas
+        self.gas_price = gas_price
+        self.denom = denom
+        self.timeout = timeout
+        self.sequences = SequenceManager(self.account)
+        self.signers = {}
+        for name, key in KEYS.items():
+            signer = Signer(key)
+            self.signers[name] = self.signers[signer.address] = signer
+
+    def signer(self, from_):
+        "resolve signer by key name or bech32 address"
+        return self.signers[from_]
+
+    def rpc_call(self, method, **params):
+        rsp = SESSION.post(
+            self.rpc,
+            json={"jsonrpc": "2.0", "id": 1, "method": method, "params": params},
+            timeout=self.timeout,
+        ).json()
+        assert "error" not in rsp, rsp["error"]
+        return rsp["result"]
+
+    def account(self, addr):
+        "return account number and sequence"
+        req = new(QueryAccountRequest, address=addr)
+        res = self.rpc_call(
+            "abci_query",
+            path="/cosmos.auth.v1beta1.Query/Account",
+            data=bytes(req.SerializeToString()).hex(),
+        )["response"]
+        assert res.get("code", 0) == 0, res.get("log")
+        rsp = QueryAccountResponse()
+        rsp.ParseFromString(base64.b64decode(res["value"]))
+        if rsp.account.type_url.endswith(".BaseAccount"):
+            acct = BaseAccount()
+            acct.ParseFromString(rsp.account.value)
+        else:
+            acct = VestingAccount()
+            acct.ParseFromString(rsp.account.value)
+            acct = acct.base_vesting_account.base_account
+        return acct.account_number or 0, acct.sequence or 0
+
+    def build(self, msgs, signer, account_number, sequence, gas=None, memo=""):
+        "return the signed tx bytes"
+        gas = gas or self.gas
+        fee = math.ceil(gas * self.gas_price)
+        body = new(TxBody, messages=[pack(msg) for msg in msgs], memo=memo)
+        auth_info = new(
+            AuthInfo,
+            signer_infos=[
+                new(
+                    SignerInfo,
+                    public_key=signer.public_key(),
+                    mode_info=new(
+                        ModeInfo, single=new(ModeInfoSingle, mode=SIGN_MODE_DIRECT)
+                    ),
+                    sequence=sequence,
+                )
+            ],
+            fee=new(
+                Fee,
+                amount=[new(Coin, denom=self.denom, amount=str(fee))],
+                gas_limit=gas,
+            ),
+        )
+        body_bytes = bytes(body.SerializeToString())
+        auth_info_bytes = bytes(auth_info.SerializeToString())
+        sign_doc = new(
+            SignDoc,
+            body_bytes=body_bytes,
+            auth_info_bytes=auth_info_bytes,
+            chain_id=self.chain_id,
+            account_number=account_number,
+        )
+        sig = signer.sign(bytes(sign_doc.SerializeToString()))
+        tx = new(
+            TxRaw,
+            body_bytes=body_bytes,
+            auth_info_bytes=auth_info_bytes,
+            signatures=[sig],
+        )
+        return bytes(tx.SerializeToString())
+
+    def broadcast(
+        self,
+        msgs,
+        from_,
+        gas=None,
+        memo="",
+        sequence=None,
+        event_query_tx=True,
+        max_retries=3,
+    ):
+        """
+        sign the msgs with `from_` and broadcast in sync mode,
+        the result has the same shape as the `CosmosCLI` tx methods.
+
+        the sequence is allocated locally unless specified, set
+        `event_query_tx=False` to return once the tx is in mempool,
+        so the following txs of the same account can go into the same block.
+        """
+        signer = self.signer(from_)
+        for _ in range(max_retries):
+            if sequence is None:
+                account_number, seq = self.sequences.next(signer.address)
+            else:
+                account_number = self.sequences.account_number(signer.address)
+                seq = sequence
+            tx = self.build(msgs, signer, account_number, seq, gas=gas, memo=memo)
+            res = self.rpc_call("broadcast_tx_sync", tx=base64.b64encode(tx).decode())
+            rsp = {
+                "code": res["code"],
+                "codespace": res.get("codespace", ""),
+                "txhash": res["hash"],
+                "raw_log": res.get("log", ""),
+            }
+            if (
+                rsp["code"] != ERR_WRONG_SEQUENCE
+                or rsp["codespace"] != "sdk"
+                or sequence is not None
+            ):
+                break
+            # the expected sequence counts the pending txs in mempool too
+            m = re.search(r"expected (\d+)", rsp["raw_log"])
+            self.sequences.reset(signer.address, int(m.group(1)) if m else None)
+        if rsp["code"] == 0 and event_query_tx:
+            rsp = self.cli.event_query_tx_for(rsp["txhash"])
+        return rsp
+
+    def transfer(self, from_, to, coins, **kwargs):
+        sender = self.signer(from_).address
+        msg = new(
+            MsgSend, from_address=sender, to_address=to, amount=parse_coins(coins)
+        )
+        return self.broadcast([msg], from_, **kwargs)
+
+    def delegate_amount(self, validator_address, amt, from_, **kwargs):
+        msg = new(
+            MsgDelegate,
+            delegator_address=self.signer(from_).address,
+            validator_address=validator_address,
+            amount=parse_coins(amt)[0],
+        )
+        return self.broadcast([msg], from_, **kwargs)
+
+    def unbond_amount(self, validator_address, amt, from_, **kwargs):
+        msg = new(
+            MsgUndelegate,
+            delegator_address=self.signer(from_).address,
+            validator_address=validator_address,
+            amount=parse_coins(amt)[0],
+        )
+        return self.broadcast([msg], from_, **kwargs)
+
+    def redelegate(self, from_validator, to_validator, amt, from_, **kwargs):
+        msg = new(
+            MsgBeginRedelegate,
+            delegator_address=self.signer(from_).address,
+            validator_src_address=from_validator,
+            validator_dst_address=to_validator,
+            amount=parse_coins(amt)[0],
+        )
+        return self.broadcast([msg], from_, **kwargs)
+
+    def withdraw_rewards(self, val_addr, from_, **kwargs):
+        msg = new(
+            MsgWithdrawDelegatorReward,
+            delegator_address=self.signer(from_).address,
+            validator_address=val_addr,
+        )
+        return self.broadcast([msg], from_, **kwargs)
+
+    def withdraw_validator_commission(self, val_addr, from_, **kwargs):
+        msg = new(MsgWithdrawValidatorCommission, validator_address=val_addr)
+        return self.broadcast([msg], from_, **kwargs)
+
+    def set_withdraw_addr(self, addr, from_, **kwargs):
+        msg = new(
+            MsgSetWithdrawAddress,
+            delegator_address=self.signer(from_).address,
+            withdraw_address=addr,
+        )
+        return self.broadcast([msg], from_, **kwargs)
+
+    def fund_community_pool(self, amt, from_, **kwargs):
+        msg = new(
+            MsgFundCommunityPool,
+            amount=parse_coins(amt),
+            depositor=self.signer(from_).address,
+        )
+        return self.broadcast([msg], from_, **kwargs)
+
+    def create_tokenfactory_denom(self, subdenom, from_, **kwargs):
+        msg = new(MsgCreateDenom, sender=self.signer(from_).address, subdenom=subdenom)
+        return self.broadcast([msg], from_, **kwargs)
+
+    def mint_tokenfactory_denom(self, coin, from_, to=None, **kwargs):
+        msg = new(
+            MsgMint,
+            sender=self.signer(from_).address,
+            amount=parse_coins(coin)[0],
+            mintToAddress=to,
+        )
+        return self.broadcast([msg], from_, **kwargs)
+
+    def burn_tokenfactory_denom(self, coin, from_, burn_from=None, **kwargs):
+        msg = new(
+            MsgBurn,
+            sender=self.signer(from_).address,
+            amount=parse_coins(coin)[0],
+            burnFromAddress=burn_from,
+        )
+        return self.broadcast([msg], from_, **kwargs)
+
+    def update_tokenfactory_admin(self, denom, address, from_, **kwargs):
+        msg = new(
+            MsgChangeAdmin,
+            sender=self.signer(from_).address,
+            denom=denom,
+            new_admin=address,
+        )
+        return self.broadcast([msg], from_, **kwargs)
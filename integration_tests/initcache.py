@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dateutil.parser import isoparse
+
+from .utils import MNEMONICS
+
+# the files copied from the cache are rewritten, so they can't be hardlinks
+# shared with the cache, reflink is used when the filesystem supports it.
+CP_REFLINK = ["cp", "-R", "-p", "--reflink=auto"]
+VESTING_TIME_FIELDS = ("start_time", "end_time")
+# binary path -> (size, mtime_ns, sha256)
+BINARY_HASHES = {}
+
+
+def binary_hash(cmd):
+    "hash the content of the chain binary, cached by size and mtime"
+    path = shutil.which(cmd)
+    if path is None:
+        return cmd
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    cached = BINARY_HASHES.get(path)
+    if cached is None or cached[:2] != (st.st_size, st.st_mtime_ns):
+        h = hashlib.sha256()
+        with open(path, "rb") as fp:
+            while chunk := fp.read(1 << 20):
+                h.update(chunk)
+        BINARY_HASHES[path] = cached = (st.st_size, st.st_mtime_ns, h.hexdigest())
+    return cached[2]
+
+
+def cache_key(data, base_port, relayer, chain_binary=None):
+    """
+    the content address of the `pystarport init` output,
+    the expanded config, the chain binaries and the mnemonics determine it.
+    """
+    cmds = {chain_binary} if chain_binary else set()
+    cmds |= {v["cmd"] for v in data.values() if isinstance(v, dict) and "cmd" in v}
+    h = hashlib.sha256()
+    h.update(json.dumps(data, sort_keys=True).encode())
+    h.update(json.dumps(sorted(MNEMONICS.items()), default=str).encode())
+    h.update(json.dumps([base_port, relayer]).encode())
+    for cmd in sorted(cmds):
+        h.update(binary_hash(cmd).encode())
+    return h.hexdigest()
+
+
+def copy_tree(src, dst):
+    "reflink copy if possible, otherwise a normal copy"
+    dst.mkdir(parents=True, exist_ok=True)
+    srcs = [str(p) for p in src.iterdir()]
+    if not srcs:
+        return
+    try:
+        subprocess.run([*CP_REFLINK, *srcs, str(dst)], check=True)
+    except (OSError, subprocess.CalledProcessError):
+        shutil.copytree(src, dst, symlinks=True, dirs_exist_ok=True)
+
+
+def save(cache_dir, key, path):
+    "store the initialized data dir, racing writers are fine"
+    target = Path(cache_dir) / key
+    if target.exists():
+        return
+    tmp = Path(cache_dir) / f".{key}.{uuid.uuid4().hex}"
+    copy_tree(path, tmp)
+    (tmp / ".source").write_text(str(path))
+    try:
+        tmp.rename(target)
+    except OSError:
+        # saved by another process concurrently
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def restore(cache_dir, key, path, shift_genesis_time=True):
+    "copy the cached data dir into path, return False if not cached"
+    src = Path(cache_dir) / key
+    if not (src / ".source").exists():
+        return False
+    copy_tree(src, path)
+    source = (path / ".source").read_text()
+    (path / ".source").unlink()
+    rewrite_paths(path, source, str(path))
+    if shift_genesis_time:
+        now = datetime.now(timezone.utc)
+        for genesis in path.glob("*/node*/config/genesis.json"):
+            shift_genesis(genesis, now)
+    return True
+
+
+def rewrite_paths(path, old, new):
+    "the configs (tasks.ini, relayer config, etc.) refer to the absolute data path"
+    old, new = old.encode(), new.encode()
+    for p in path.rglob("*"):
+        if not p.is_file() or p.is_symlink():
+            continue
+        data = p.read_bytes()
+        if old in data:
+            p.write_bytes(data.replace(old, new))
+
+
+def shift_genesis(path, now=None):
+    """
+    move the genesis time to now, and the vesting schedules with it,
+    as if the cluster was just initialized.
+    """
+    genesis = json.loads(path.read_text())
+    now = now or datetime.now(timezone.utc)
+    delta = int((now - isoparse(genesis["genesis_time"])).total_seconds())
+    genesis["genesis_time"] = now.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def shift(obj):
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                if k in VESTING_TIME_FIELDS and str(v).isdigit():
+                    obj[k] = type(v)(int(v) + delta)
+                else:
+                    shift(v)
+        elif isinstance(obj, list):
+            for v in obj:
+                shift(v)
+
+    shift(genesis["app_state"].get("auth", {}).get("accounts", []))
+    path.write_text(json.dumps(genesis, indent=2))
@@ -1,7 +1,8 @@
 import json
 import os
-import signal
+import shutil
 import subprocess
+from contextlib import contextmanager
 from pathlib import Path
 
 import _jsonnet
@@ -18,12 +19,21 @@ from web3 import AsyncHTTPProvider, AsyncWeb3, HTTPProvider, WebSocketProvider
 from web3.middleware import ExtraDataToPOAMiddleware
 from web3.providers.rpc.utils import ExceptionRetryConfiguration
 
-from .cosmoscli import CosmosCLI
+from . import initcache, readiness, teardown
+from .blockclock import register_block_clock
+from .checkpoint import snapshot
+from .cosmoscli import AsyncCosmosCLI, CosmosCLI
+from .cosmostx import reset_sequences
+from .portalloc import config_span, port_range, remap_ports
+from .timing import instrument
 from .utils import (
     CHAIN_ID,
     CMD,
+    INIT_CACHE_DIR,
+    QUERY_BACKEND,
     supervisorctl,
     wait_for_block,
+    wait_for_new_blocks,
     wait_for_port,
     wait_for_url,
 )
@@ -32,6 +42,10 @@ RETRY_CONFIG = ExceptionRetryConfiguration(
     errors=(ConnectionError, HTTPError, Timeout, TooManyRedirects),
     retries=10,
 )
+# the config of the session cluster
+MANTRA_CONFIG = Path(__file__).parent / "configs/enable-indexer.jsonnet"
+# the dirs of a node home holding the chain state, e.g. the wasm code store
+STATE_DIRS = ("data", "wasm")
 
 
 class Mantra:
@@ -42,6 +56,16 @@ class Mantra:
         self.config = json.loads((base_dir / "config.json").read_text())
         self.chain_binary = chain_binary
         self._use_websockets = False
+        for i in range(len(self.config["validators"])):
+            self.block_clock(i)
+
+    def block_clock(self, i=0):
+        "the clock of the node, shared by all the wait helpers"
+        return register_block_clock(
+            self.w3_ws_endpoint(i),
+            self.w3_http_endpoint(i),
+            "http://127.0.0.1:%d" % ports.rpc_port(self.base_port(i)),
+        )
 
     def copy(self):
         return Mantra(self.base_dir)
@@ -68,26 +92,28 @@ class Mantra:
 
     def node_w3(self, i=0):
         if self._use_websockets:
-            return web3.Web3(
+            w3 = web3.Web3(
                 WebSocketProvider(
                     self.w3_ws_endpoint(i), exception_retry_configuration=RETRY_CONFIG
                 )
             )
         else:
-            return web3.Web3(
+            w3 = web3.Web3(
                 HTTPProvider(
                     self.w3_http_endpoint(i), exception_retry_configuration=RETRY_CONFIG
                 )
             )
+        return instrument(w3, node=i)
 
     def async_node_w3(self, i=0):
-        return AsyncWeb3(
+        w3 = AsyncWeb3(
             AsyncHTTPProvider(
                 self.w3_http_endpoint(i),
                 cache_allowed_requests=True,
                 exception_retry_configuration=RETRY_CONFIG,
             ),
         )
+        return instrument(w3, node=i)
 
     def base_port(self, i):
         return self.config["validators"][i]["base_port"]
@@ -95,8 +121,19 @@ class Mantra:
     def node_rpc(self, i):
         return "tcp://127.0.0.1:%d" % ports.rpc_port(self.base_port(i))
 
+    def node_api(self, i):
+        return "http://127.0.0.1:%d" % ports.api_port(self.base_port(i))
+
     def cosmos_cli(self, i=0) -> CosmosCLI:
-        return CosmosCLI(self.node_home(i), self.node_rpc(i), self.chain_binary)
+        return CosmosCLI(
+            self.node_home(i),
+            self.node_rpc(i),
+            self.chain_binary,
+            api=self.node_api(i) if QUERY_BACKEND == "rest" else None,
+        )
+
+    def async_cosmos_cli(self, i=0, semaphore=None) -> AsyncCosmosCLI:
+        return AsyncCosmosCLI(self.cosmos_cli(i), semaphore=semaphore)
 
     def node_home(self, i=0):
         return self.base_dir / f"node{i}"
@@ -108,19 +145,82 @@ class Mantra:
     def supervisorctl(self, *args):
         return supervisorctl(self.base_dir / "../tasks.ini", *args)
 
+    def node_programs(self):
+        chain_id = self.base_dir.name
+        return [f"{chain_id}-node{i}" for i in range(len(self.config["validators"]))]
+
+    def checkpoint_dir(self, name):
+        return self.base_dir / ".checkpoints" / name
+
+    def wait_ready(self, timeout=120):
+        "wait for the rpc, json-rpc, websocket and grpc of all the nodes"
+        probes = {}
+        for i in range(len(self.config["validators"])):
+            probes.update(readiness.node_probes(self.node_home(i), f"node{i}"))
+        readiness.wait_ready(probes, timeout)
+
+    @contextmanager
+    def stopped(self):
+        "stop the nodes in the block, and wait for them to make blocks again"
+        programs = self.node_programs()
+        self.supervisorctl("stop", *programs)
+        try:
+            yield programs
+        finally:
+            self.supervisorctl("start", *programs)
+        self.wait_ready()
+        wait_for_new_blocks(self.cosmos_cli(), 1)
+
+    def checkpoint(self, name="default"):
+        "snapshot the state dirs of the nodes"
+        with self.stopped() as programs:
+            for i in range(len(programs)):
+                for sub in STATE_DIRS:
+                    src = self.node_home(i) / sub
+                    dst = self.checkpoint_dir(name) / f"node{i}" / sub
+                    if src.exists():
+                        snapshot(src, dst)
+
+    def restore(self, name="default"):
+        "rewind the nodes to the checkpoint, which can be restored again"
+        with self.stopped() as programs:
+            for i in range(len(programs)):
+                for sub in STATE_DIRS:
+                    src = self.checkpoint_dir(name) / f"node{i}" / sub
+                    dst = self.node_home(i) / sub
+                    if src.exists():
+                        snapshot(src, dst)
+                    else:
+                        # e.g. the wasm dir created after the checkpoint
+                        shutil.rmtree(dst, ignore_errors=True)
+            # the local sequences are ahead of the restored chain
+            reset_sequences()
+
+    def drop_checkpoint(self, name="default"):
+        shutil.rmtree(self.checkpoint_dir(name), ignore_errors=True)
+
 
 class Hermes:
     def __init__(self, config: Path):
         self.configpath = config
         self.config = tomlkit.loads(config.read_text())
-        self.port = 3000
+        self.port = self.config.get("rest", {}).get("port", 3000)
 
 
 class ConnectMantra:
-    def __init__(self, rpc, evm_rpc, evm_rpc_ws, chain_id, chain_binary="mantrachaind"):
+    def __init__(
+        self,
+        rpc,
+        evm_rpc,
+        evm_rpc_ws,
+        chain_id,
+        chain_binary="mantrachaind",
+        api=None,
+    ):
         self._w3 = None
         self._async_w3 = None
         self.rpc = rpc
+        self.api = api
         self.evm_rpc = evm_rpc
         self.evm_rpc_ws = evm_rpc_ws
         self.chain_id = chain_id
@@ -141,27 +241,38 @@ class ConnectMantra:
 
     def node_w3(self):
         if self._use_websockets:
-            return web3.Web3(
+            w3 = web3.Web3(
                 WebSocketProvider(
                     self.evm_rpc_ws, exception_retry_configuration=RETRY_CONFIG
                 )
             )
         else:
-            return web3.Web3(
+            w3 = web3.Web3(
                 HTTPProvider(self.evm_rpc, exception_retry_configuration=RETRY_CONFIG)
             )
+        return instrument(w3, node=self.evm_rpc)
 
     def async_node_w3(self):
-        return AsyncWeb3(
+        w3 = AsyncWeb3(
             AsyncHTTPProvider(
                 self.evm_rpc,
                 cache_allowed_requests=True,
                 exception_retry_configuration=RETRY_CONFIG,
             )
         )
+        return instrument(w3, node=self.evm_rpc)
 
     def cosmos_cli(self, home) -> CosmosCLI:
-        return CosmosCLI(home, self.rpc, self.chain_binary, self.chain_id)
+        return CosmosCLI(
+            home,
+            self.rpc,
+            self.chain_binary,
+            self.chain_id,
+            api=self.api if QUERY_BACKEND == "rest" else None,
+        )
+
+    def async_cosmos_cli(self, home, semaphore=None) -> AsyncCosmosCLI:
+        return AsyncCosmosCLI(self.cosmos_cli(home), semaphore=semaphore)
 
     def use_websocket(self, use=True):
         self._w3 = None
@@ -169,8 +280,15 @@ class ConnectMantra:
 
 
 def setup_mantra(path, base_port, chain):
-    cfg = Path(__file__).parent / ("configs/enable-indexer.jsonnet")
-    yield from setup_custom_mantra(path, base_port, cfg, chain=chain)
+    yield from setup_custom_mantra(path, base_port, MANTRA_CONFIG, chain=chain)
+
+
+def expand_config(config, chain=None):
+    "evaluate the jsonnet config with the ext vars, and expand it"
+    data = json.loads(
+        _jsonnet.evaluate_file(str(config), ext_vars={"CHAIN_CONFIG": chain})
+    )
+    return expand(data, None, config)
 
 
 def setup_custom_mantra(
@@ -186,56 +304,76 @@ def setup_custom_mantra(
 ):
     assert config.suffix == ".jsonnet"
 
-    # expand jsonnet with ext vars
-    data = json.loads(
-        _jsonnet.evaluate_file(str(config), ext_vars={"CHAIN_CONFIG": chain})
-    )
-    data = expand(data, None, config)
-    config = path / "expanded_config.json"
-    config.write_text(json.dumps(data, indent=2))
-
-    cmd = [
-        "pystarport",
-        "init",
-        "--config",
-        config,
-        "--data",
-        path,
-        "--base_port",
-        str(base_port),
-        "--no_remove",
-    ]
-    if relayer == cluster.Relayer.RLY.value:
-        cmd = cmd + ["--relayer", str(relayer)]
-    if chain_binary is not None:
-        cmd = cmd[:1] + ["--cmd", chain_binary] + cmd[1:]
-    print(*cmd)
-    subprocess.run(cmd, check=True)
-    if post_init is not None:
-        post_init(path, base_port, config, genesis)
-    proc = subprocess.Popen(
-        ["pystarport", "start", "--data", path, "--quiet"],
-        preexec_fn=os.setsid,
-    )
-    try:
-        if wait_port:
-            wait_for_port(ports.rpc_port(base_port))
-        c = Mantra(path / CHAIN_ID, chain_binary=chain_binary or chain)
-        wait_for_block(c.cosmos_cli(), 1)
-        yield c
-    finally:
-        os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
-        # proc.terminate()
-        proc.wait()
+    data = expand_config(config, chain)
+    with port_range(base_port, config_span(data)) as base_port:
+        remap_ports(data, base_port)
+        config = path / "expanded_config.json"
+        config.write_text(json.dumps(data, indent=2))
+
+        cmd = [
+            "pystarport",
+            "init",
+            "--config",
+            config,
+            "--data",
+            path,
+            "--base_port",
+            str(base_port),
+            "--no_remove",
+        ]
+        if relayer == cluster.Relayer.RLY.value:
+            cmd = cmd + ["--relayer", str(relayer)]
+        if chain_binary is not None:
+            cmd = cmd[:1] + ["--cmd", chain_binary] + cmd[1:]
+        key = None
+        if INIT_CACHE_DIR:
+            key = initcache.cache_key(data, base_port, relayer, chain_binary)
+        if key and initcache.restore(
+            INIT_CACHE_DIR, key, path, "genesis_time" not in json.dumps(data)
+        ):
+            print("restored the initialized data dir from cache", key)
+        else:
+            print(*cmd)
+            subprocess.run(cmd, check=True)
+            if key:
+                initcache.save(INIT_CACHE_DIR, key, path)
+        if post_init is not None:
+            post_init(path, base_port, config, genesis)
+        proc = subprocess.Popen(
+            ["pystarport", "start", "--data", path, "--quiet"],
+            preexec_fn=os.setsid,
+        )
+        try:
+            c = Mantra(path / CHAIN_ID, chain_binary=chain_binary or chain)
+            if wait_port:
+                c.wait_ready()
+            else:
+                wait_for_block(c.cosmos_cli(), 1)
+            yield c
+        finally:
+            teardown.stop(proc, path)
 
 
 def connect_custom_mantra():
     rpc = os.getenv("RPC", "http://127.0.0.1:26657")
     evm_rpc = os.getenv("EVM_RPC", "http://127.0.0.1:26651")
     evm_rpc_ws = os.getenv("EVM_RPC_WS", "ws://127.0.0.1:26652")
+    api = os.getenv("API")
     wait_for_url(rpc)
     wait_for_url(evm_rpc)
-    yield ConnectMantra(rpc, evm_rpc, evm_rpc_ws, CHAIN_ID, chain_binary=CMD)
+    yield ConnectMantra(rpc, evm_rpc, evm_rpc_ws, CHAIN_ID, chain_binary=CMD, api=api)
+
+
+def connect_local_mantra(mantra):
+    "connect to the first node of a local cluster like to an external one"
+    return ConnectMantra(
+        "http://127.0.0.1:%d" % ports.rpc_port(mantra.base_port(0)),
+        mantra.w3_http_endpoint(0),
+        mantra.w3_ws_endpoint(0),
+        CHAIN_ID,
+        chain_binary=mantra.chain_binary,
+        api=mantra.node_api(0),
+    )
 
 
 class Geth:
@@ -245,7 +383,9 @@ class Geth:
 
 
 def setup_geth(path, base_port):
-    with (path / "geth.log").open("w") as logfile:
+    with port_range(base_port, 2) as base_port, (path / "geth.log").open(
+        "w"
+    ) as logfile:
         cmd = [
             "start-geth",
             path,
@@ -274,6 +414,4 @@ def setup_geth(path, base_port):
             async_w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
             yield Geth(w3, async_w3)
         finally:
-            os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
-            # proc.terminate()
-            proc.wait()
+            teardown.stop(proc, path)
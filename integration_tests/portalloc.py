@@ -0,0 +1,148 @@
+import fcntl
+import json
+import os
+import socket
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+# the leases of all the local test processes, e.g. the pytest-xdist workers
+LEASES_FILE = Path(
+    os.getenv("PORT_LEASES_FILE")
+    or Path(tempfile.gettempdir()) / "mantrachain-e2e-ports.json"
+)
+PORT_MIN = 10000
+PORT_MAX = 60000
+# the port distance of the validators, assumed by pystarport
+VALIDATOR_SPAN = 10
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def ports_free(base, span, host="127.0.0.1"):
+    for port in range(base, base + span):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                s.bind((host, port))
+            except OSError:
+                return False
+    return True
+
+
+@contextmanager
+def locked_leases():
+    "the lease table guarded by a file lock, stale leases are dropped"
+    with open(LEASES_FILE.with_suffix(".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            leases = json.loads(LEASES_FILE.read_text())
+        except (OSError, ValueError):
+            leases = []
+        leases = [lease for lease in leases if pid_alive(lease["pid"])]
+        try:
+            yield leases
+        finally:
+            tmp = LEASES_FILE.with_suffix(f".{os.getpid()}")
+            tmp.write_text(json.dumps(leases))
+            tmp.replace(LEASES_FILE)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def lease(hint, span):
+    """
+    lease the port range `[base, base + span)`, `base` is the `hint` if that
+    range is available, otherwise the next available one after it.
+    """
+    with locked_leases() as leases:
+        base = hint
+        for _ in range((PORT_MAX - PORT_MIN) // span + len(leases) + 1):
+            if base + span > PORT_MAX:
+                base = PORT_MIN
+            overlap = next(
+                (
+                    x
+                    for x in leases
+                    if x["base"] < base + span and base < x["base"] + x["span"]
+                ),
+                None,
+            )
+            if overlap is not None:
+                base = overlap["base"] + overlap["span"]
+            elif not ports_free(base, span):
+                base += span
+            else:
+                break
+        else:
+            raise RuntimeError(f"no free port range of size {span}")
+        leases.append({"base": base, "span": span, "pid": os.getpid()})
+    return base
+
+
+def release(base):
+    with locked_leases() as leases:
+        leases[:] = [
+            x for x in leases if not (x["base"] == base and x["pid"] == os.getpid())
+        ]
+
+
+@contextmanager
+def port_range(hint, span):
+    "lease a port range for the lifetime of a cluster"
+    base = lease(hint, span)
+    try:
+        yield base
+    finally:
+        release(base)
+
+
+def chain_spans(data):
+    """
+    the port span of each chain in the expanded pystarport config,
+    with room for one more node added at runtime, e.g. statesync.
+    """
+    return {
+        chain_id: VALIDATOR_SPAN * (len(cfg.get("validators", [])) + 1)
+        for chain_id, cfg in data.items()
+        if chain_id != "relayer"
+    }
+
+
+def config_span(data):
+    "the ports used by the chains and the relayer's rest server"
+    return sum(chain_spans(data).values()) + ("relayer" in data)
+
+
+def remap_ports(data, base):
+    """
+    place the chains next to each other from `base`: the chain inheriting
+    `--base_port` first, then the ones with explicit validator `base_port`
+    (e.g. the second chain of ibc) in any order, as jsonnet sorts the keys,
+    and the relayer's rest server after them.
+    """
+    spans = chain_spans(data)
+
+    def explicit(chain_id):
+        validators = data[chain_id].get("validators", [])
+        return bool(validators) and all("base_port" in v for v in validators)
+
+    offset = 0
+    for chain_id in sorted(spans, key=explicit):
+        if explicit(chain_id):
+            validators = data[chain_id]["validators"]
+            start = min(v["base_port"] for v in validators)
+            for v in validators:
+                v["base_port"] = base + offset + v["base_port"] - start
+        offset += spans[chain_id]
+    rest = data.get("relayer", {}).get("rest")
+    if rest is not None:
+        rest["port"] = base + offset
+    return data
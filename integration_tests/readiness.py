@@ -0,0 +1,112 @@
+import json
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import tomlkit
+from websockets.sync.client import connect
+
+# the client connection preface and an empty SETTINGS frame of http/2
+H2_PREFACE = (
+    b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n" + b"\x00\x00\x00\x04\x00\x00\x00\x00\x00"
+)
+H2_SETTINGS = 0x4
+
+
+def split_address(address):
+    "`tcp://127.0.0.1:26657` or `127.0.0.1:8545` -> (host, port)"
+    host, _, port = address.rsplit("/", 1)[-1].rpartition(":")
+    if host in ("", "0.0.0.0"):
+        host = "127.0.0.1"
+    return host, int(port)
+
+
+def probe_status(host, port):
+    "the cometbft rpc serves the status, and the first block is committed"
+    rsp = requests.get(f"http://{host}:{port}/status", timeout=2)
+    rsp.raise_for_status()
+    info = rsp.json()["result"]["sync_info"]
+    assert int(info["latest_block_height"]) >= 1, "no block committed yet"
+
+
+def probe_json_rpc(host, port):
+    rsp = requests.post(
+        f"http://{host}:{port}",
+        json={"jsonrpc": "2.0", "id": 1, "method": "eth_blockNumber", "params": []},
+        timeout=2,
+    )
+    rsp.raise_for_status()
+    assert "result" in rsp.json(), rsp.text
+
+
+def probe_ws(host, port):
+    with connect(f"ws://{host}:{port}", open_timeout=2, close_timeout=1) as ws:
+        ws.send(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_chainId"}))
+        msg = json.loads(ws.recv(timeout=2))
+        assert "result" in msg, msg
+
+
+def probe_grpc(host, port):
+    "the grpc server answers the http/2 preface with its SETTINGS frame"
+    with socket.create_connection((host, port), timeout=2) as s:
+        s.sendall(H2_PREFACE)
+        header = b""
+        while len(header) < 9:
+            chunk = s.recv(9 - len(header))
+            assert chunk, "connection closed"
+            header += chunk
+        assert header[3] == H2_SETTINGS, f"unexpected frame {header.hex()}"
+
+
+def node_probes(home, name):
+    "the probes of the enabled endpoints, read from the node's configs"
+    config = tomlkit.loads((home / "config/config.toml").read_text())
+    app = tomlkit.loads((home / "config/app.toml").read_text())
+    probes = {f"{name} rpc": (probe_status, split_address(config["rpc"]["laddr"]))}
+    json_rpc = app.get("json-rpc", {})
+    if json_rpc.get("enable"):
+        probes[f"{name} json-rpc"] = (
+            probe_json_rpc,
+            split_address(json_rpc["address"]),
+        )
+        if json_rpc.get("ws-address"):
+            probes[f"{name} ws"] = (probe_ws, split_address(json_rpc["ws-address"]))
+    grpc = app.get("grpc", {})
+    if grpc.get("enable") and grpc.get("address"):
+        probes[f"{name} grpc"] = (probe_grpc, split_address(grpc["address"]))
+    return probes
+
+
+def retry(probe, addr, deadline, backoff=0.05, max_backoff=1.0):
+    "run the probe until it succeeds, return the last error at the deadline"
+    while True:
+        try:
+            probe(*addr)
+            return None
+        except Exception as e:
+            error = e
+        if time.monotonic() + backoff > deadline:
+            return error
+        time.sleep(backoff)
+        backoff = min(backoff * 2, max_backoff)
+
+
+def wait_ready(probes, timeout=120):
+    """
+    probe all the endpoints concurrently with back-off,
+    return as soon as every one of them answers a real request.
+    """
+    deadline = time.monotonic() + timeout
+    with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+        futs = {
+            name: executor.submit(retry, probe, addr, deadline)
+            for name, (probe, addr) in probes.items()
+        }
+        errors = {name: fut.result() for name, fut in futs.items()}
+    errors = {name: e for name, e in errors.items() if e is not None}
+    if errors:
+        raise TimeoutError(
+            "endpoints not ready: "
+            + ", ".join(f"{name} ({e!r})" for name, e in errors.items())
+        )
@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from hexbytes import HexBytes
+from web3.exceptions import TimeExhausted, TransactionNotFound, Web3RPCError
+
+from .utils import w3_wait_for_block
+
+
+class ReceiptCollector:
+    """
+    resolve the receipts of many txs block by block,
+    each new block costs one `eth_getBlockReceipts` call,
+    instead of one polling loop per tx hash.
+    """
+
+    def __init__(self, w3, timeout=120):
+        self.w3 = w3
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.pending = {}
+        # tx hash -> the deadline of its receipt
+        self.deadlines = {}
+        # the submitted hashes not yet checked against the past blocks
+        self.unchecked = []
+        self.thread = None
+
+    def submit(self, txhash):
+        "return the future of the tx receipt"
+        txhash = HexBytes(txhash)
+        with self.lock:
+            if txhash not in self.pending:
+                self.pending[txhash] = Future()
+                self.deadlines[txhash] = time.monotonic() + self.timeout
+                self.unchecked.append(txhash)
+            fut = self.pending[txhash]
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return fut
+
+    def wait(self, txhashes):
+        "return the receipts in the same order, within the timeout"
+        futs = [self.submit(txhash) for txhash in txhashes]
+        deadline = time.monotonic() + self.timeout
+        try:
+            return [fut.result(max(deadline - time.monotonic(), 0)) for fut in futs]
+        except FutureTimeoutError as e:
+            raise TimeExhausted(f"receipts not found in {self.timeout}s") from e
+
+    def resolve(self, receipt):
+        with self.lock:
+            txhash = HexBytes(receipt["transactionHash"])
+            fut = self.pending.pop(txhash, None)
+            self.deadlines.pop(txhash, None)
+        if fut is not None:
+            fut.set_result(receipt)
+
+    def check(self, txhashes):
+        """
+        look up the txs which may be included before they are watched,
+        grouped by block to fetch the receipts once per block.
+        """
+        heights = set()
+        for txhash in txhashes:
+            try:
+                height = self.w3.eth.get_transaction(txhash)["blockNumber"]
+            except TransactionNotFound:
+                continue
+            if height is not None:
+                heights.add(height)
+        for height in sorted(heights):
+            for receipt in self.block_receipts(height):
+                self.resolve(receipt)
+
+    def expire(self):
+        "fail the txs not included before their deadline, e.g. the dropped ones"
+        now = time.monotonic()
+        with self.lock:
+            expired = [h for h, deadline in self.deadlines.items() if deadline <= now]
+            futs = [self.pending.pop(h) for h in expired]
+            for h in expired:
+                del self.deadlines[h]
+        for h, fut in zip(expired, futs):
+            fut.set_exception(
+                TimeExhausted(f"tx {h.hex()} is not included in {self.timeout}s")
+            )
+
+    def block_receipts(self, height):
+        try:
+            return self.w3.eth.get_block_receipts(height)
+        except Web3RPCError:
+            # the node don't support eth_getBlockReceipts
+            with self.lock:
+                pending = set(self.pending)
+            txs = self.w3.eth.get_block(height).transactions
+            return [
+                self.w3.eth.get_transaction_receipt(txhash)
+                for txhash in txs
+                if HexBytes(txhash) in pending
+            ]
+
+    def run(self):
+        try:
+            height = self.w3.eth.block_number
+            while True:
+                with self.lock:
+                    unchecked, self.unchecked = self.unchecked, []
+                self.check(unchecked)
+                with self.lock:
+                    if not self.pending:
+                        self.thread = None
+                        return
+                height += 1
+                w3_wait_for_block(self.w3, height, timeout=self.timeout)
+                for receipt in self.block_receipts(height):
+                    self.resolve(receipt)
+                self.expire()
+        except Exception as e:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                self.deadlines = {}
+                self.unchecked = []
+                self.thread = None
+            for fut in pending.values():
+                fut.set_exception(e)
+
+
+def wait_for_receipts(w3, txhashes, timeout=120):
+    "wait for the receipts of many txs, polling once per block"
+    return ReceiptCollector(w3, timeout=timeout).wait(txhashes)
@@ -0,0 +1,119 @@
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import uuid
+from pathlib import Path
+
+IMPORT_PATTERN = re.compile(
+    r"""^\s*import\s+(?:[^;]*?\s+from\s+)?["']([^"']+)["']""", re.MULTILINE
+)
+
+
+@functools.lru_cache(maxsize=None)
+def solc_version(cmd="solc"):
+    "the full version string of the solc binary"
+    path = shutil.which(cmd) or cmd
+    return subprocess.check_output([path, "--version"]).decode().strip()
+
+
+def parse_remappings(remappings):
+    "`prefix=target` pairs, the longest prefix first"
+    pairs = [r.split("=", 1) for r in remappings if "=" in r]
+    return sorted(pairs, key=lambda p: -len(p[0]))
+
+
+def resolve_import(path, importer, base_path, remappings):
+    if path.startswith("."):
+        return (importer.parent / path).resolve()
+    for prefix, target in remappings:
+        if path.startswith(prefix):
+            path = target + path[len(prefix) :]
+            break
+    return (base_path / path).resolve()
+
+
+def sources(entry, base_path, remappings):
+    "the source file and its transitive imports, the missing ones are None"
+    remappings = parse_remappings(remappings)
+    todo = [Path(entry).resolve()]
+    seen = {}
+    while todo:
+        path = todo.pop()
+        if path in seen:
+            continue
+        try:
+            text = path.read_bytes()
+        except OSError:
+            seen[path] = None
+            continue
+        seen[path] = text
+        for imp in IMPORT_PATTERN.findall(text.decode(errors="replace")):
+            todo.append(resolve_import(imp, path, base_path, remappings))
+    return seen
+
+
+def cache_key(entry, flags, remappings, base_path="contracts"):
+    """
+    the content address of the build: the source and its transitive imports,
+    the remappings, the solc version and the flags.
+    """
+    base_path = Path(base_path).resolve()
+    h = hashlib.sha256()
+    h.update(json.dumps([solc_version(), flags, remappings]).encode())
+    for path, text in sorted(sources(entry, base_path, remappings).items()):
+        digest = hashlib.sha256(text).hexdigest() if text is not None else None
+        h.update(json.dumps([os.path.relpath(path, base_path), digest]).encode())
+    return h.hexdigest()
+
+
+def load(cache_dir, key):
+    "the cached abi, bytecode and runtime code, None if not cached"
+    try:
+        return json.loads((Path(cache_dir) / f"{key}.json").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def save(cache_dir, key, result):
+    "write the entry atomically, the concurrent writers race harmlessly"
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_dir / f".{key}.{uuid.uuid4().hex}"
+    tmp.write_text(json.dumps(result))
+    tmp.replace(cache_dir / f"{key}.json")
+
+
+def compile_standard(units, settings, base_path):
+    """
+    compile the source units in one `solc --standard-json` call,
+    no files are written, so the concurrent builds can't race.
+    """
+    data = {
+        "language": "Solidity",
+        "sources": {unit: {"urls": [unit]} for unit in units},
+        "settings": settings,
+    }
+    cmd = ["solc", "--standard-json", "--base-path", base_path]
+    print(*cmd, *units)
+    output = json.loads(
+        subprocess.run(
+            cmd, input=json.dumps(data), capture_output=True, text=True, check=True
+        ).stdout
+    )
+    errors = [e for e in output.get("errors", []) if e["severity"] == "error"]
+    if errors:
+        raise RuntimeError("\n".join(e["formattedMessage"] for e in errors))
+    return output
+
+
+def artifact(contract):
+    "the abi, bytecode and runtime code of a contract in the standard-json output"
+    return {
+        "abi": contract["abi"],
+        "bytecode": "0x" + contract["evm"]["bytecode"]["object"],
+        "code": "0x" + contract["evm"]["deployedBytecode"]["object"],
+    }
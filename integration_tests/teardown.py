@@ -0,0 +1,89 @@
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# the seconds a cluster has to exit after SIGTERM, before it's SIGKILLed
+STOP_TIMEOUT = float(os.getenv("STOP_TIMEOUT", "20"))
+
+# keep the data dirs for troubleshooting once a test failed, unless disabled
+STATE = {"prune_on_failure": False, "failed": False}
+EXECUTOR = ThreadPoolExecutor(thread_name_prefix="teardown")
+LOCK = threading.Lock()
+PENDING = set()
+
+
+def group_alive(pgid):
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def kill_group(proc, timeout=STOP_TIMEOUT):
+    """
+    SIGTERM the process group of the cluster, and SIGKILL what's left of it
+    after the timeout, so a node hanging on shutdown can't stall the session.
+    """
+    pgid = proc.pid
+    try:
+        os.killpg(pgid, signal.SIGTERM)
+    except ProcessLookupError:
+        proc.wait()
+        return
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        proc.poll()
+        if not group_alive(pgid):
+            break
+        time.sleep(0.1)
+    else:
+        print(f"process group {pgid} is not stopped, kill it", file=sys.stderr)
+        try:
+            os.killpg(pgid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    proc.wait()
+
+
+def prune(path):
+    if STATE["failed"] and not STATE["prune_on_failure"]:
+        print("keep the data dir of the failed run:", path)
+        return
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _stop(proc, path):
+    kill_group(proc)
+    if path is not None:
+        prune(path)
+
+
+def stop(proc, path=None):
+    """
+    stop the cluster started in its own process group in background,
+    and remove its data dir afterwards.
+    """
+    try:
+        fut = EXECUTOR.submit(_stop, proc, path)
+    except RuntimeError:
+        # the interpreter is exiting, e.g. a cluster booted after the session
+        _stop(proc, path)
+        return None
+    with LOCK:
+        PENDING.add(fut)
+    fut.add_done_callback(lambda f: PENDING.discard(f))
+    return fut
+
+
+def join():
+    "wait for the clusters being stopped, e.g. at the end of the session"
+    with LOCK:
+        futs = list(PENDING)
+    for fut in wait(futs).done:
+        if fut.exception() is not None:
+            print(f"teardown failed: {fut.exception()!r}", file=sys.stderr)
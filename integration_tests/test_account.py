@@ -54,3 +54,15 @@ def test_future_blk(mantra, connect_mantra):
     with pytest.raises(web3.exceptions.Web3RPCError) as exc:
         w3.eth.get_transaction_count(acc, hex(future))
     assert "cannot query with height in the future" in str(exc)
+
+
+def test_local_address(mantra):
+    "the in process resolved addresses should match the keyring ones"
+    for i in range(2):
+        cli = mantra.cosmos_cli(i)
+        for name in ["validator", "community", "signer1"]:
+            for bech in ["acc", "val"]:
+                addr = cli.local_address(name, bech)
+                if addr is not None:
+                    assert addr == cli.keyring_address(name, bech, skip_create=True)
+                assert cli.address(name, bech) == cli.keyring_address(name, bech)
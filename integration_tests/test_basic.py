@@ -10,6 +10,7 @@ from eth_contract.utils import send_transaction as send_transaction_async
 from eth_utils import big_endian_to_int
 from hexbytes import HexBytes
 
+from .receipts import wait_for_receipts
 from .utils import (
     ACCOUNTS,
     ADDRS,
@@ -521,7 +522,7 @@ def test_failed_transfer_tx(mantra):
     rsp = cli.broadcast_tx_json(cosmos_tx)
     assert rsp["code"] == 0, rsp["raw_log"]
 
-    receipts = [w3.eth.wait_for_transaction_receipt(h) for h in tx_hashes]
+    receipts = wait_for_receipts(w3, tx_hashes)
     assert receipts[0].status == receipts[1].status == 1
     assert receipts[2].status == 0
 
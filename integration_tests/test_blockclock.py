@@ -0,0 +1,45 @@
+import asyncio
+import itertools
+
+import pytest
+
+from .blockclock import BlockClock
+
+
+def clock():
+    "the subscription never connects, so the waiters poll"
+    return BlockClock("ws://127.0.0.1:1", poll_interval=0.01)
+
+
+def test_wait_polls_without_subscription():
+    heights = itertools.count(1)
+    c = clock()
+    assert c.wait(5, lambda: next(heights), timeout=5) == 5
+    assert not c.connected
+
+
+def test_wait_timeout():
+    c = clock()
+    with pytest.raises(TimeoutError):
+        c.wait(5, lambda: 1, timeout=0.1)
+
+
+def test_wait_ignores_poll_errors():
+    heights = iter([RuntimeError("connection refused"), 1, RuntimeError(), 2])
+
+    def poll():
+        h = next(heights)
+        if isinstance(h, Exception):
+            raise h
+        return h
+
+    assert clock().wait(2, poll, timeout=5) == 2
+
+
+def test_wait_async_polls_without_subscription():
+    heights = itertools.count(1)
+
+    async def poll():
+        return next(heights)
+
+    assert asyncio.run(clock().wait_async(5, poll, timeout=5)) == 5
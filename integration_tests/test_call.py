@@ -250,6 +250,8 @@ async def test_connect_opcode(connect_mantra):
 
 @pytest.mark.asyncio
 async def test_opcode(mantra, connect_mantra):
-    contract = await build_and_deploy_contract_async(connect_mantra.async_w3, "Random")
+    contract = await build_and_deploy_contract_async(
+        connect_mantra.async_w3, "Random", reuse=True
+    )
     res = await contract.caller.randomTokenId()
     assert res > 0, res
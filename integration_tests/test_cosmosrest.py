@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from .cosmosrest import CosmosREST, normalize
+from .utils import find_log_event_attrs, module_address, submit_gov_proposal
+
+# rewind the gov proposal of the module
+pytestmark = pytest.mark.usefixtures("isolated_mantra")
+
+
+def clients(mantra):
+    "the cli answering the queries itself, and the rest backend to compare with"
+    cli = mantra.cosmos_cli()
+    cli.rest = None
+    return cli, CosmosREST(mantra.node_api(0))
+
+
+def test_rest_query(mantra):
+    "the rest backend should answer the same as the cli"
+    cli, rest = clients(mantra)
+    height = cli.block_height()
+    addr = cli.address("community")
+    assert rest.balances(addr, height=height) == cli.balances(addr, height=height)
+    acct = rest.account(addr)["account"]
+    expected = cli.account(addr)["account"]
+    assert acct["type"] == expected["type"]
+    for field in ["address", "account_number"]:
+        assert acct["value"][field] == expected["value"][field]
+    assert rest.get_params("staking") == cli.get_params("staking")
+    assert rest.validators() == cli.validators()
+
+
+def test_rest_query_defaults(mantra):
+    "the false, zero and empty fields are omitted the same as the cli"
+    cli, rest = clients(mantra)
+    pool = json.loads(cli.raw("q", "staking", "pool", **cli.get_base_kwargs()))
+    assert rest.staking_pool() == (pool.get("pool") or pool)
+    # the gov params have the false flags, e.g. burn_vote_quorum
+    params = normalize(rest.get("/cosmos/gov/v1/params/tallying"))
+    assert params["params"] == cli.get_params("gov")["params"]
+
+
+@pytest.mark.slow
+def test_rest_query_tally(mantra, tmp_path):
+    cli, rest = clients(mantra)
+    p = cli.get_params("evm")["params"]
+    rsp = submit_gov_proposal(
+        mantra,
+        tmp_path,
+        messages=[
+            {
+                "@type": "/cosmos.evm.vm.v1.MsgUpdateParams",
+                "authority": module_address("gov"),
+                "params": p,
+            },
+        ],
+        gas=300_000,
+    )
+    ev = find_log_event_attrs(
+        rsp["events"], "submit_proposal", lambda attrs: "proposal_id" in attrs
+    )
+    # the final tally, with the zero no and abstain counts
+    tally = rest.query_tally(ev["proposal_id"])
+    assert tally == cli.query_tally(ev["proposal_id"])
@@ -0,0 +1,44 @@
+from .cosmostx import CosmosTxBuilder
+from .utils import DEFAULT_DENOM, find_fee
+
+
+def test_transfer_in_process(mantra):
+    """
+    check the tx built and signed in process is accepted
+    """
+    cli = mantra.cosmos_cli()
+    builder = CosmosTxBuilder(cli)
+    addr_a = cli.address("community")
+    addr_b = cli.address("signer2")
+    balance_a = cli.balance(addr_a)
+    balance_b = cli.balance(addr_b)
+    amt = 1
+    rsp = builder.transfer("community", addr_b, f"{amt}{DEFAULT_DENOM}")
+    assert rsp["code"] == 0, rsp["raw_log"]
+    fee = find_fee(rsp)
+    assert cli.balance(addr_a) == balance_a - amt - fee
+    assert cli.balance(addr_b) == balance_b + amt
+
+
+def test_pipelined_transfers(mantra):
+    "the locally allocated sequences let one account send several txs per block"
+    cli = mantra.cosmos_cli()
+    builder = CosmosTxBuilder(cli)
+    addr_b = cli.address("signer2")
+    balance_b = cli.balance(addr_b)
+    # start with a stale sequence to exercise the resync
+    builder.sequences.accounts[builder.signer("community").address] = [
+        builder.sequences.account_number(builder.signer("community").address),
+        0,
+    ]
+    txhashes = []
+    for _ in range(5):
+        rsp = builder.transfer(
+            "community", addr_b, f"1{DEFAULT_DENOM}", event_query_tx=False
+        )
+        assert rsp["code"] == 0, rsp["raw_log"]
+        txhashes.append(rsp["txhash"])
+    results = [cli.event_query_tx_for(txhash) for txhash in txhashes]
+    assert all(rsp["code"] == 0 for rsp in results)
+    assert len({rsp["height"] for rsp in results}) < len(results)
+    assert cli.balance(addr_b) == balance_b + len(txhashes)
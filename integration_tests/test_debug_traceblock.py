@@ -3,6 +3,7 @@ import requests
 import web3
 from pystarport import ports
 
+from .receipts import wait_for_receipts
 from .utils import (
     derive_new_account,
     send_transaction,
@@ -44,8 +45,7 @@ def test_traceblock(mantra):
         else:
             txhash = w3.eth.send_raw_transaction(signed.raw_transaction)
             txhashes.append(txhash)
-    for txhash in txhashes[0 : total - 1]:
-        res = w3.eth.wait_for_transaction_receipt(txhash)
+    for res in wait_for_receipts(w3, txhashes[0 : total - 1]):
         assert res.status == 1
 
     def trace_blk(blk):
@@ -15,7 +15,7 @@ pytestmark = pytest.mark.asyncio
 
 async def test_get_logs_by_topic(mantra):
     w3: AsyncWeb3 = mantra.async_w3
-    contract = await build_and_deploy_contract_async(w3, "Greeter")
+    contract = await build_and_deploy_contract_async(w3, "Greeter", reuse=True)
     topic = f"0x{Web3.keccak(text='ChangeGreeting(address,string)').hex()}"
     tx = await contract.functions.setGreeting("world").build_transaction()
     res = await send_transaction(w3, ACCOUNTS["community"], **tx)
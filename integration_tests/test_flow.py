@@ -1,16 +1,20 @@
 import os
 
 import pytest
+from eth_contract.utils import ZERO_ADDRESS
 
 from .network import ConnectMantra
 from .utils import (
     ADDRS,
+    DEFAULT_DENOM,
     DEFAULT_GAS,
     DEFAULT_GAS_AMT,
     WEI_PER_DENOM,
+    BalanceSnapshot,
     assert_balance,
     derive_new_account,
     eth_to_bech32,
+    find_fee,
     get_balance,
     recover_community,
     send_transaction,
@@ -97,3 +101,26 @@ def test_flow(mantra, connect_mantra: ConnectMantra, tmp_path):
     balance_community_evm += value
     assert w3.eth.get_balance(acc_test1.address) == 0
     assert assert_balance(cli, w3, community, True) == balance_community_evm
+
+
+def test_balance_snapshot(mantra):
+    "the diff of the snapshots around a transfer is the amount and the fee"
+    cli = mantra.cosmos_cli()
+    sender = cli.address("community")
+    receiver = ADDRS["signer1"]
+    addrs = [sender, receiver]
+    before = BalanceSnapshot.take(cli, addrs, w3=mantra.w3, tokens=[ZERO_ADDRESS])
+    for addr in addrs:
+        assert before[(addr, ZERO_ADDRESS)] // WEI_PER_DENOM == before[addr]
+    amt = 1000
+    rsp = cli.transfer(sender, eth_to_bech32(receiver), f"{amt}{DEFAULT_DENOM}")
+    assert rsp["code"] == 0, rsp["raw_log"]
+    fee = find_fee(rsp)
+    after = BalanceSnapshot.take(
+        cli, addrs, w3=mantra.w3, tokens=[ZERO_ADDRESS], height=int(rsp["height"])
+    )
+    diff = after - before
+    assert diff[sender] == -(amt + fee)
+    assert diff[(sender, ZERO_ADDRESS)] == -(amt + fee) * WEI_PER_DENOM
+    assert diff[receiver] == amt
+    assert diff[(receiver, ZERO_ADDRESS)] == amt * WEI_PER_DENOM
@@ -11,14 +11,8 @@ from .utils import (
 pytestmark = pytest.mark.asyncio
 
 
-BURN_GAS_CONTRACT = None
-
-
 async def get_burn_gas_contract(w3):
-    global BURN_GAS_CONTRACT
-    if BURN_GAS_CONTRACT is None:
-        BURN_GAS_CONTRACT = await build_and_deploy_contract_async(w3, "BurnGas")
-    return BURN_GAS_CONTRACT
+    return await build_and_deploy_contract_async(w3, "BurnGas", reuse=True)
 
 
 async def test_gas_call(mantra):
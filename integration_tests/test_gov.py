@@ -17,6 +17,9 @@ from .utils import (
     submit_gov_proposal,
 )
 
+# rewind the gov proposals of the module
+pytestmark = pytest.mark.usefixtures("isolated_mantra")
+
 
 @pytest.mark.slow
 def test_submit_any_proposal(mantra, tmp_path):
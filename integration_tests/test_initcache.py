@@ -0,0 +1,54 @@
+import json
+from datetime import datetime, timezone
+
+from . import initcache
+
+
+def test_shift_genesis(tmp_path):
+    path = tmp_path / "genesis.json"
+    genesis = {
+        "genesis_time": "2024-01-01T00:00:00Z",
+        "app_state": {
+            "auth": {
+                "accounts": [
+                    {
+                        "@type": "/cosmos.vesting.v1beta1.ContinuousVestingAccount",
+                        "start_time": "1704067200",
+                        "base_vesting_account": {"end_time": "1704070800"},
+                    },
+                    {
+                        "@type": "/cosmos.vesting.v1beta1.PeriodicVestingAccount",
+                        "start_time": 1704067300,
+                        "vesting_periods": [{"length": "3600"}],
+                    },
+                ]
+            },
+            # only the vesting schedules move with the genesis time
+            "gov": {"start_time": "1704067200"},
+        },
+    }
+    path.write_text(json.dumps(genesis))
+    initcache.shift_genesis(path, datetime(2024, 1, 1, 1, tzinfo=timezone.utc))
+    genesis = json.loads(path.read_text())
+    assert genesis["genesis_time"] == "2024-01-01T01:00:00.000000Z"
+    accounts = genesis["app_state"]["auth"]["accounts"]
+    assert accounts[0]["start_time"] == "1704070800"
+    assert accounts[0]["base_vesting_account"]["end_time"] == "1704074400"
+    assert accounts[1]["start_time"] == 1704070900
+    assert accounts[1]["vesting_periods"] == [{"length": "3600"}]
+    assert genesis["app_state"]["gov"] == {"start_time": "1704067200"}
+
+
+def test_rewrite_paths(tmp_path):
+    old = "/tmp/pytest-of-runner/pytest-0/mantra0"
+    src = tmp_path / "mantra"
+    (src / "node0" / "config").mkdir(parents=True)
+    tasks = src / "tasks.ini"
+    tasks.write_text(f"command = mantrachaind start --home {old}/node0\n")
+    config = src / "node0" / "config" / "client.toml"
+    config.write_text('node = "tcp://127.0.0.1:26657"\n')
+    (src / "node0" / "link").symlink_to(tasks)
+    initcache.rewrite_paths(src, old, str(src))
+    assert tasks.read_text() == f"command = mantrachaind start --home {src}/node0\n"
+    assert config.read_text() == 'node = "tcp://127.0.0.1:26657"\n'
+    assert (src / "node0" / "link").is_symlink()
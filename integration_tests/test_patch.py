@@ -2,7 +2,7 @@ import pytest
 
 from .utils import module_address, submit_gov_proposal
 
-pytestmark = pytest.mark.slow
+pytestmark = [pytest.mark.slow, pytest.mark.usefixtures("isolated_mantra")]
 
 
 def test_int_overflow(mantra, tmp_path):
@@ -30,10 +30,10 @@ def custom_mantra(request, tmp_path_factory):
 async def transfer(cli, user, addr_b):
     nonce_locks = defaultdict(asyncio.Lock)
     async with nonce_locks[user]:
-        rsp = await asyncio.to_thread(
-            cli.transfer, user, addr_b, f"1{DEFAULT_DENOM}", event_query_tx=False
+        rsp = await cli.transfer(
+            user, addr_b, f"1{DEFAULT_DENOM}", event_query_tx=False
         )
-    rsp = await asyncio.to_thread(cli.event_query_tx_for, rsp["txhash"])
+    rsp = await cli.event_query_tx_for(rsp["txhash"])
     assert rsp["code"] == 4, rsp["raw_log"]
     assert f"{addr_b} is not allowed to receive funds" in rsp["raw_log"]
     return rsp
@@ -85,8 +85,9 @@ async def test_transfers_not_allowed(custom_mantra):
     for user, group in groupby(sorted(pairs), key=lambda x: x[0]):
         user_groups[user] = list(group)
 
+    async_cli = custom_mantra.async_cosmos_cli()
     user_tasks = [
-        execute_user_transfers(cli, modules) for _, modules in user_groups.items()
+        execute_user_transfers(async_cli, modules) for _, modules in user_groups.items()
     ]
 
     await asyncio.gather(*user_tasks)
@@ -0,0 +1,78 @@
+import os
+import socket
+
+import pytest
+
+from . import portalloc
+
+
+@pytest.fixture
+def leases_file(tmp_path, monkeypatch):
+    path = tmp_path / "ports.json"
+    monkeypatch.setattr(portalloc, "LEASES_FILE", path)
+    return path
+
+
+def ibc_config():
+    "the chain inheriting --base_port sorts after the one with explicit ports"
+    return {
+        "evm-canary-net-1": {
+            "validators": [{"base_port": 26800}, {"base_port": 26810}],
+        },
+        "mantra-canary-net-1": {"validators": [{}, {}, {}]},
+        "relayer": {"rest": {"enabled": True, "port": 3000}},
+    }
+
+
+def test_config_span():
+    # one spare node slot per chain, and the relayer's rest port
+    assert portalloc.config_span(ibc_config()) == 30 + 40 + 1
+    assert portalloc.config_span({"chain": {"validators": [{}]}}) == 20
+
+
+def test_remap_ports():
+    data = portalloc.remap_ports(ibc_config(), 40000)
+    # mantra uses 40000 + i * 10 for its 3 validators and the spare slot
+    assert [v["base_port"] for v in data["evm-canary-net-1"]["validators"]] == [
+        40040,
+        40050,
+    ]
+    assert data["mantra-canary-net-1"]["validators"] == [{}, {}, {}]
+    assert data["relayer"]["rest"]["port"] == 40070
+
+
+def test_remap_ports_keeps_validator_distance():
+    data = {"chain": {"validators": [{"base_port": 26800}, {"base_port": 26820}]}}
+    portalloc.remap_ports(data, 30000)
+    assert [v["base_port"] for v in data["chain"]["validators"]] == [30000, 30020]
+
+
+def test_lease_release(leases_file):
+    base = portalloc.lease(40000, 20)
+    assert base >= 40000
+    # the overlapping ranges are skipped
+    other = portalloc.lease(base, 20)
+    assert other >= base + 20
+    portalloc.release(base)
+    portalloc.release(other)
+    assert portalloc.lease(base, 20) == base
+    portalloc.release(base)
+
+
+def test_lease_drops_dead_processes(leases_file):
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    leases_file.write_text(f'[{{"base": 41000, "span": 20, "pid": {pid}}}]')
+    assert portalloc.lease(41000, 20) == 41000
+    portalloc.release(41000)
+
+
+def test_port_range_skips_ports_in_use(leases_file):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen()
+        port = s.getsockname()[1]
+        with portalloc.port_range(port, 5) as base:
+            assert not base <= port < base + 5
@@ -7,7 +7,7 @@ from eth_account import Account
 from eth_contract.utils import send_transaction as send_transaction_async
 from eth_contract.utils import sign_transaction as sign_transaction_async
 
-from .network import setup_custom_mantra
+from .receipts import wait_for_receipts
 from .utils import (
     ADDRS,
     DEFAULT_DENOM,
@@ -116,7 +116,7 @@ def test_priority(mantra):
     # but the later sent txs should be included earlier.
     txhashes = [w3.eth.send_raw_transaction(tx.raw_transaction) for tx in signed]
 
-    receipts = [w3.eth.wait_for_transaction_receipt(txhash) for txhash in txhashes]
+    receipts = wait_for_receipts(w3, txhashes)
     print(receipts)
     assert all(receipt.status == 1 for receipt in receipts), "expect all txs success"
 
@@ -137,13 +137,13 @@ def conver_gas_prices(base_fee, value):
 
 
 @pytest.fixture(scope="module")
-def custom_mantra(request, tmp_path_factory):
+def custom_mantra(request, cluster_pool):
     chain = request.config.getoption("chain_config")
-    path = tmp_path_factory.mktemp("default")
-    yield from setup_custom_mantra(
-        path,
+    yield from cluster_pool.acquire(
+        "default",
         27100,
         Path(__file__).parent / "configs/default.jsonnet",
+        exclusive=True,
         chain=chain,
     )
 
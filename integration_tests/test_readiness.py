@@ -0,0 +1,53 @@
+import pytest
+
+from . import readiness
+
+
+def test_split_address():
+    assert readiness.split_address("tcp://127.0.0.1:26657") == ("127.0.0.1", 26657)
+    assert readiness.split_address("0.0.0.0:8545") == ("127.0.0.1", 8545)
+    assert readiness.split_address(":9090") == ("127.0.0.1", 9090)
+
+
+def test_node_probes(tmp_path):
+    (tmp_path / "config").mkdir()
+    (tmp_path / "config/config.toml").write_text(
+        '[rpc]\nladdr = "tcp://127.0.0.1:26657"\n'
+    )
+    (tmp_path / "config/app.toml").write_text(
+        "[json-rpc]\n"
+        "enable = true\n"
+        'address = "127.0.0.1:8545"\n'
+        'ws-address = "127.0.0.1:8546"\n'
+        "[grpc]\n"
+        "enable = false\n"
+        'address = "127.0.0.1:9090"\n'
+    )
+    probes = readiness.node_probes(tmp_path, "node0")
+    assert probes == {
+        "node0 rpc": (readiness.probe_status, ("127.0.0.1", 26657)),
+        "node0 json-rpc": (readiness.probe_json_rpc, ("127.0.0.1", 8545)),
+        "node0 ws": (readiness.probe_ws, ("127.0.0.1", 8546)),
+    }
+
+
+def test_wait_ready():
+    calls = []
+
+    def flaky(host, port):
+        calls.append(port)
+        assert len(calls) >= 3, "not ready"
+
+    def broken(host, port):
+        raise ConnectionRefusedError(port)
+
+    readiness.wait_ready({"flaky": (flaky, ("127.0.0.1", 1))}, timeout=5)
+    assert len(calls) == 3
+    with pytest.raises(TimeoutError, match="broken"):
+        readiness.wait_ready(
+            {
+                "ok": (lambda host, port: None, ("127.0.0.1", 1)),
+                "broken": (broken, ("127.0.0.1", 2)),
+            },
+            timeout=0.2,
+        )
@@ -6,18 +6,17 @@ from eth_utils import to_checksum_address
 from hexbytes import HexBytes
 from web3.exceptions import Web3RPCError
 
-from .network import setup_custom_mantra
 from .utils import send_transaction
 
 
 @pytest.fixture(scope="module")
-def mantra_replay(request, tmp_path_factory):
+def mantra_replay(request, cluster_pool):
     chain = request.config.getoption("chain_config")
-    path = tmp_path_factory.mktemp("mantra-replay")
-    yield from setup_custom_mantra(
-        path,
+    yield from cluster_pool.acquire(
+        "mantra-replay",
         26400,
         Path(__file__).parent / "configs/default.jsonnet",
+        exclusive=True,
         chain=chain,
     )
 
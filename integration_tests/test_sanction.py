@@ -13,7 +13,7 @@ from .utils import (
     submit_gov_proposal,
 )
 
-pytestmark = pytest.mark.slow
+pytestmark = [pytest.mark.slow, pytest.mark.usefixtures("isolated_mantra")]
 
 
 def test_blacklist(mantra, tmp_path):
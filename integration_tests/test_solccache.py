@@ -0,0 +1,47 @@
+import pytest
+
+from . import solccache
+
+
+@pytest.fixture
+def contracts(tmp_path, monkeypatch):
+    "A imports B, which imports C through a remapping"
+    monkeypatch.setattr(solccache, "solc_version", lambda: "0.8.28+commit.7893614a")
+    base = tmp_path / "contracts"
+    (base / "deps").mkdir(parents=True)
+    (base / "A.sol").write_text('import "./B.sol";\ncontract A is B {}\n')
+    (base / "B.sol").write_text('import {C} from "lib/C.sol";\ncontract B is C {}\n')
+    (base / "deps" / "C.sol").write_text("contract C {}\n")
+    (base / "D.sol").write_text("contract D {}\n")
+    return base
+
+
+def key(base, flags=("--optimize",), remappings=("lib/=deps/",)):
+    return solccache.cache_key(base / "A.sol", list(flags), list(remappings), base)
+
+
+def test_cache_key_transitive_imports(contracts):
+    orig = key(contracts)
+    assert key(contracts) == orig
+    # not imported
+    (contracts / "D.sol").write_text("contract D { uint x; }\n")
+    assert key(contracts) == orig
+    (contracts / "deps" / "C.sol").write_text("contract C { uint x; }\n")
+    changed = key(contracts)
+    assert changed != orig
+    (contracts / "deps" / "C.sol").unlink()
+    assert key(contracts) not in (orig, changed)
+
+
+def test_cache_key_settings(contracts, monkeypatch):
+    orig = key(contracts)
+    assert key(contracts, flags=()) != orig
+    assert key(contracts, remappings=("lib/=deps/", "x/=y/")) != orig
+    monkeypatch.setattr(solccache, "solc_version", lambda: "0.8.29+commit.ab55807c")
+    assert key(contracts) != orig
+
+
+def test_save_load(tmp_path):
+    assert solccache.load(tmp_path, "missing") is None
+    solccache.save(tmp_path / "cache", "k", {"abi": []})
+    assert solccache.load(tmp_path / "cache", "k") == {"abi": []}
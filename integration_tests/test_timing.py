@@ -0,0 +1,80 @@
+from collections import defaultdict, deque
+
+import pytest
+
+from . import timing
+
+
+@pytest.fixture
+def state(monkeypatch):
+    "an empty timing state, restored after the test"
+    monkeypatch.setattr(
+        timing, "TIMES", defaultdict(lambda: defaultdict(lambda: [0.0, 0]))
+    )
+    monkeypatch.setattr(timing, "WALL", {})
+    monkeypatch.setattr(timing, "CURRENT", {"test": None})
+
+
+def test_nested_calls_attributed_to_outermost(state):
+    timing.begin_test("test_mod.py::test_a")
+    with timing.timed("wait"):
+        # e.g. the cli calls made by wait_for_block
+        with timing.timed("cli"):
+            pass
+    with timing.timed("cli"):
+        pass
+    timing.end_test("test_mod.py::test_a", 10)
+    categories = timing.report()["tests"]["test_mod.py::test_a"]["categories"]
+    assert categories["wait"]["calls"] == 1
+    assert categories["cli"]["calls"] == 1
+
+
+def test_report_breakdown(state):
+    for nodeid, wall, waited in [
+        ("test_mod.py::test_a", 10, 4),
+        ("test_mod.py::test_b", 5, 1),
+    ]:
+        timing.begin_test(nodeid)
+        timing.record("wait", waited)
+        timing.record("rpc", 1)
+        timing.end_test(nodeid, wall)
+    data = timing.report()
+    test = data["tests"]["test_mod.py::test_a"]
+    assert test["wall"] == 10
+    assert test["categories"]["wait"] == {"time": 4, "calls": 1}
+    assert test["categories"]["other"] == {"time": 5, "calls": 0}
+    module = data["modules"]["test_mod.py"]
+    assert module["wall"] == 15
+    assert module["categories"]["wait"] == {"time": 5, "calls": 2}
+    assert module["categories"]["other"] == {"time": 8, "calls": 0}
+    # the header and the module, a blank line, the title, the header and the tests
+    assert len(timing.summary_lines(data)) == 2 + 1 + 2 + 2
+
+
+def test_percentile():
+    latencies = list(range(1, 101))
+    assert timing.percentile(latencies, 0.5) == 51
+    assert timing.percentile(latencies, 0.95) == 96
+    assert timing.percentile(latencies, 0.99) == 100
+    assert timing.percentile(latencies, 1) == 100
+    assert timing.percentile([7], 0.99) == 7
+
+
+def test_latency_report(monkeypatch):
+    monkeypatch.setattr(timing, "LEDGER", deque(maxlen=3))
+    for latency, error in [(0.004, None), (0.001, None), (0.002, "Timeout")]:
+        timing.LEDGER.append(("rpc", "eth_call", "node0", latency, 100, error))
+    timing.LEDGER.append(("cli", "q bank balances", "node0", 0.05, 10, None))
+    # the oldest call is evicted from the bounded ledger
+    res = timing.latency_report()
+    assert res["rpc eth_call"] == {
+        "calls": 2,
+        "errors": 1,
+        "avg_size": 100,
+        "p50": 2.0,
+        "p95": 2.0,
+        "p99": 2.0,
+        "max": 2.0,
+    }
+    assert res["cli q bank balances"]["p50"] == 50.0
+    assert len(timing.latency_lines(res)) == 3
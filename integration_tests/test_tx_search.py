@@ -0,0 +1,17 @@
+def test_iter_tx_search(mantra):
+    "paging with a small page size should yield the same txs"
+    cli = mantra.cosmos_cli()
+    query = "message.module='bank'"
+    txs = cli.tx_search_rpc(query)
+    assert len(txs) > 1
+    paged = [tx["hash"] for tx in cli.iter_tx_search(query, per_page=1)]
+    assert paged[: len(txs)] == [tx["hash"] for tx in txs]
+    it = cli.iter_tx_search(query, per_page=1)
+    tx = next(it)
+    assert tx["hash"] == txs[0]["hash"]
+    it.close()
+    # decoded on demand to the cli's tx result
+    assert "response" not in vars(tx)
+    exp = cli.event_query_tx_for_cli(tx["hash"])
+    for k in ["height", "txhash", "code", "timestamp", "events", "tx"]:
+        assert tx.response[k] == exp[k], k
@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import DEFAULT_DENOM, wait_for_new_blocks
+
+
+def test_tx_stream(mantra):
+    "the txs confirmed by the websocket stream should match the cli results"
+    cli = mantra.cosmos_cli()
+    addr_a = cli.address("community")
+    addr_b = cli.address("signer2")
+    hashes = []
+    for _ in range(3):
+        rsp = cli.transfer(addr_a, addr_b, f"1{DEFAULT_DENOM}", event_query_tx=False)
+        assert rsp["code"] == 0, rsp["raw_log"]
+        hashes.append(rsp["txhash"])
+        wait_for_new_blocks(cli, 1)
+    with ThreadPoolExecutor(len(hashes)) as executor:
+        results = list(executor.map(cli.event_query_tx_for, hashes))
+    for txhash, rsp in zip(hashes, results):
+        exp = cli.event_query_tx_for_cli(txhash)
+        for k in [
+            "height",
+            "txhash",
+            "code",
+            "gas_wanted",
+            "gas_used",
+            "timestamp",
+            "events",
+            "tx",
+        ]:
+            assert rsp[k] == exp[k], k
+    # the options only supported by the cli
+    rsp = cli.event_query_tx_for(hashes[0], home=cli.data_dir)
+    assert rsp["txhash"] == hashes[0]
@@ -0,0 +1,278 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from web3.middleware import Web3Middleware
+
+# the category of the outermost timed call in the current thread or task,
+# the nested calls are attributed to it, e.g. the cli calls in wait_for_block.
+_active = contextvars.ContextVar("timing_active", default=None)
+
+LOCK = threading.Lock()
+# test nodeid -> category -> [seconds, calls]
+TIMES = defaultdict(lambda: defaultdict(lambda: [0.0, 0]))
+# test nodeid -> wall time of setup, call and teardown
+WALL = {}
+# the running test, None outside of the tests
+CURRENT = {"test": None}
+# the recent calls: (kind, method, node, latency, size, error),
+# appending to a bounded deque is atomic, so no lock is needed.
+LEDGER = deque(maxlen=int(os.getenv("LEDGER_SIZE", "200000")))
+
+
+def record(category, elapsed):
+    with LOCK:
+        item = TIMES[CURRENT["test"]][category]
+        item[0] += elapsed
+        item[1] += 1
+
+
+@contextmanager
+def timed(category):
+    "attribute the wall time of the block to the category"
+    if _active.get() is not None:
+        yield
+        return
+    token = _active.set(category)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _active.reset(token)
+        record(category, time.perf_counter() - start)
+
+
+def timed_fn(category):
+    "decorate sync or async functions with `timed`"
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with timed(category):
+                    return await fn(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with timed(category):
+                    return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def ledger_call(kind, method, node):
+    "record the latency and error of the call, the caller can fill in the size"
+    call = {"size": 0, "error": None}
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call["error"] = type(e).__name__
+        raise
+    finally:
+        latency = time.perf_counter() - start
+        LEDGER.append((kind, method, node, latency, call["size"], call["error"]))
+
+
+def cli_method(cmd, args):
+    "the subcommand path, e.g. `q bank balances`"
+    words = [cmd]
+    for arg in args[:2]:
+        if not isinstance(arg, str) or arg.startswith("-"):
+            break
+        words.append(arg)
+    return " ".join(words[:3] if cmd in ("q", "query", "tx") else words[:2])
+
+
+def cli_call(fn):
+    "time the `ChainCommand` calls and record them in the ledger"
+    if inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def wrapper(self, cmd, *args, **kwargs):
+            with timed("cli"), ledger_call(
+                "cli", cli_method(cmd, args), kwargs.get("node")
+            ) as call:
+                output = await fn(self, cmd, *args, **kwargs)
+                call["size"] = len(output)
+                return output
+
+    else:
+
+        @functools.wraps(fn)
+        def wrapper(self, cmd, *args, **kwargs):
+            with timed("cli"), ledger_call(
+                "cli", cli_method(cmd, args), kwargs.get("node")
+            ) as call:
+                output = fn(self, cmd, *args, **kwargs)
+                call["size"] = len(output)
+                return output
+
+    return wrapper
+
+
+def rpc_call(node, method, params, response):
+    call = {"size": len(json.dumps(params, default=str)), "error": None}
+    if isinstance(response, dict) and response.get("error"):
+        call["error"] = str(response["error"].get("message", response["error"]))
+    return call
+
+
+class TimingMiddleware(Web3Middleware):
+    """
+    attribute the json-rpc calls to the `rpc` category,
+    and record them in the ledger, `node` is set by `instrument`.
+    """
+
+    node = None
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            with timed("rpc"), ledger_call("rpc", method, self.node) as call:
+                response = make_request(method, params)
+                call.update(rpc_call(self.node, method, params, response))
+                return response
+
+        return middleware
+
+    async def async_wrap_make_request(self, make_request):
+        async def middleware(method, params):
+            with timed("rpc"), ledger_call("rpc", method, self.node) as call:
+                response = await make_request(method, params)
+                call.update(rpc_call(self.node, method, params, response))
+                return response
+
+        return middleware
+
+
+def instrument(w3, node=None):
+    "install the timing middleware, labeling the calls with the node"
+    middleware = type("TimingMiddleware", (TimingMiddleware,), {"node": node})
+    w3.middleware_onion.add(middleware, "timing")
+    return w3
+
+
+def percentile(latencies, q):
+    "nearest rank percentile of the sorted latencies"
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+def latency_report():
+    "the latency percentiles of the recorded calls per method, in milliseconds"
+    calls = defaultdict(list)
+    errors = defaultdict(int)
+    sizes = defaultdict(int)
+    for kind, method, _, latency, size, error in list(LEDGER):
+        key = f"{kind} {method}"
+        calls[key].append(latency * 1000)
+        sizes[key] += size
+        if error is not None:
+            errors[key] += 1
+    res = {}
+    for key, latencies in calls.items():
+        latencies.sort()
+        res[key] = {
+            "calls": len(latencies),
+            "errors": errors[key],
+            "avg_size": sizes[key] // len(latencies),
+            "p50": round(percentile(latencies, 0.5), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(latencies[-1], 2),
+        }
+    return res
+
+
+def latency_lines(data):
+    lines = [
+        "%-50s %7s %6s %9s %9s %9s %9s"
+        % ("", "calls", "errors", "p50", "p95", "p99", "max")
+    ]
+    for key, v in sorted(data.items(), key=lambda kv: -kv[1]["p99"]):
+        lines.append(
+            "%-50s %7d %6d %9.1f %9.1f %9.1f %9.1f"
+            % (
+                key[:50],
+                v["calls"],
+                v["errors"],
+                v["p50"],
+                v["p95"],
+                v["p99"],
+                v["max"],
+            )
+        )
+    return lines
+
+
+def begin_test(nodeid):
+    CURRENT["test"] = nodeid
+
+
+def end_test(nodeid, wall):
+    WALL[nodeid] = wall
+    CURRENT["test"] = None
+
+
+def breakdown(wall, times):
+    res = {k: {"time": round(t, 3), "calls": n} for k, (t, n) in times.items()}
+    other = wall - sum(t for t, _ in times.values())
+    res["other"] = {"time": round(max(other, 0), 3), "calls": 0}
+    return {"wall": round(wall, 3), "categories": res}
+
+
+def report():
+    "the per-test and per-module breakdown of the wall time"
+    with LOCK:
+        tests = {
+            nodeid: breakdown(wall, TIMES.get(nodeid, {}))
+            for nodeid, wall in WALL.items()
+        }
+        modules = defaultdict(lambda: [0.0, defaultdict(lambda: [0.0, 0])])
+        for nodeid, wall in WALL.items():
+            module = modules[nodeid.split("::")[0]]
+            module[0] += wall
+            for category, (t, n) in TIMES.get(nodeid, {}).items():
+                module[1][category][0] += t
+                module[1][category][1] += n
+    return {
+        "tests": tests,
+        "modules": {k: breakdown(wall, times) for k, (wall, times) in modules.items()},
+    }
+
+
+def write_report(path, data):
+    with open(path, "w") as fp:
+        json.dump(data, fp, indent=2)
+
+
+def summary_lines(data, top=20):
+    categories = sorted(
+        {c for v in data["modules"].values() for c in v["categories"]},
+        key=lambda c: (c == "other", c),
+    )
+    header = "%-50s %9s" % ("", "wall") + "".join(" %9s" % c for c in categories)
+
+    def row(name, v):
+        times = v["categories"]
+        return "%-50s %9.1f" % (name[-50:], v["wall"]) + "".join(
+            " %9.1f" % times.get(c, {"time": 0})["time"] for c in categories
+        )
+
+    lines = [header]
+    lines += [row(name, v) for name, v in sorted(data["modules"].items())]
+    lines += ["", f"slowest {top} tests:", header]
+    tests = sorted(data["tests"].items(), key=lambda kv: -kv[1]["wall"])
+    lines += [row(name, v) for name, v in tests[:top]]
+    return lines
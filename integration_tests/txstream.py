@@ -0,0 +1,252 @@
+import base64
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import requests
+from websockets.sync.client import connect
+
+from .cosmosrest import SESSION
+
+TX_QUERY = "tm.event='Tx'"
+# keep the recently committed txs around for the waiters which come late
+RECENT_TXS = 10000
+RECENT_BLOCKS = 1000
+
+
+class TxResponse(dict):
+    """
+    the tx result of `tx_response`, the `tx` is decoded on the first access
+    by the `decode` given, e.g. the cli's, which knows the chain's messages.
+    """
+
+    def __init__(self, *args, tx_bytes=None, decode=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tx_bytes = tx_bytes
+        self.decode = decode
+
+    def with_decoder(self, decode):
+        return TxResponse(self, tx_bytes=self.tx_bytes, decode=decode)
+
+    def __missing__(self, key):
+        if key != "tx" or self.tx_bytes is None or self.decode is None:
+            raise KeyError(key)
+        tx = self["tx"] = self.decode(self.tx_bytes)
+        return tx
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+def tx_response(txhash, height, result, tx=None, timestamp=""):
+    "convert the comet tx result to the same shape as `event-query-tx-for` output"
+    data = result.get("data") or ""
+    return TxResponse(
+        {
+            "height": str(height),
+            "txhash": txhash.upper(),
+            "codespace": result.get("codespace", ""),
+            "code": result.get("code", 0),
+            "data": base64.b64decode(data).hex().upper(),
+            "raw_log": result.get("log", ""),
+            "logs": [],
+            "info": result.get("info", ""),
+            "gas_wanted": str(result.get("gas_wanted", "0")),
+            "gas_used": str(result.get("gas_used", "0")),
+            "timestamp": timestamp,
+            "events": result.get("events", []),
+        },
+        tx_bytes=tx,
+    )
+
+
+class TxStream:
+    """
+    one `tm.event='Tx'` websocket subscription of a node,
+    the committed txs are routed to the futures waiting for their hashes.
+    """
+
+    def __init__(self, rpc, session=SESSION, poll_interval=1):
+        self.rpc = rpc.rstrip("/")
+        self.ws_url = "ws" + self.rpc.removeprefix("http") + "/websocket"
+        self.session = session
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.waiters = {}
+        self.recent = OrderedDict()
+        # height -> block time, shared by the txs of a block
+        self.block_times = OrderedDict()
+        self.thread = None
+        # bumped on every subscription, None while the websocket is down
+        self.generation = 0
+        self.connected = False
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                with connect(self.ws_url, max_size=None) as ws:
+                    ws.send(
+                        json.dumps(
+                            {
+                                "jsonrpc": "2.0",
+                                "method": "subscribe",
+                                "id": 0,
+                                "params": {"query": TX_QUERY},
+                            }
+                        )
+                    )
+                    # the events are delivered after the subscription is acked
+                    ws.recv()
+                    with self.lock:
+                        self.generation += 1
+                        self.connected = True
+                    for msg in ws:
+                        self.dispatch(json.loads(msg))
+            except Exception:
+                pass
+            with self.lock:
+                self.connected = False
+                # the node is restarted or stopped, the seen txs are stale.
+                self.recent.clear()
+                if not self.waiters:
+                    self.thread = None
+                    return
+            time.sleep(self.poll_interval)
+
+    def dispatch(self, msg):
+        result = msg.get("result") or {}
+        data = result.get("data") or {}
+        if data.get("type") != "tendermint/event/Tx":
+            return
+        txhash = result["events"]["tx.hash"][0].upper()
+        tx = data["value"]["TxResult"]
+        self.resolve(
+            tx_response(
+                txhash,
+                tx["height"],
+                tx["result"],
+                tx=tx.get("tx"),
+                timestamp=self.block_time(tx["height"]),
+            )
+        )
+
+    def live(self):
+        "the generation of the live subscription, None if the websocket is down"
+        with self.lock:
+            return self.generation if self.connected else None
+
+    def block_time(self, height):
+        "the rfc3339 block time of the tx results, like the cli, empty if unknown"
+        height = int(height)
+        with self.lock:
+            if height in self.block_times:
+                return self.block_times[height]
+        try:
+            rsp = self.session.get(
+                f"{self.rpc}/header", params={"height": height}, timeout=5
+            ).json()
+            timestamp = rsp["result"]["header"]["time"]
+        except (requests.RequestException, ValueError, KeyError):
+            return ""
+        # the cli formats the time in seconds precision
+        timestamp = re.sub(r"\.\d+", "", timestamp)
+        with self.lock:
+            self.block_times[height] = timestamp
+            while len(self.block_times) > RECENT_BLOCKS:
+                self.block_times.popitem(last=False)
+        return timestamp
+
+    def resolve(self, rsp):
+        txhash = rsp["txhash"]
+        with self.lock:
+            self.recent[txhash] = rsp
+            while len(self.recent) > RECENT_TXS:
+                self.recent.popitem(last=False)
+            fut = self.waiters.pop(txhash, None)
+        if fut is not None and not fut.done():
+            fut.set_result(rsp)
+
+    def future(self, txhash):
+        with self.lock:
+            if txhash in self.recent:
+                fut = Future()
+                fut.set_result(self.recent[txhash])
+                return fut
+            return self.waiters.setdefault(txhash, Future())
+
+    def query(self, txhash):
+        "query the committed tx with the http `/tx` endpoint, None if not found"
+        try:
+            rsp = self.session.get(
+                f"{self.rpc}/tx", params={"hash": f"0x{txhash}"}, timeout=5
+            ).json()
+        except (requests.RequestException, ValueError):
+            return None
+        tx = rsp.get("result")
+        if not tx:
+            return None
+        return tx_response(
+            tx["hash"],
+            tx["height"],
+            tx["tx_result"],
+            tx=tx.get("tx"),
+            timestamp=self.block_time(tx["height"]),
+        )
+
+    def wait(self, txhash, timeout=15):
+        """
+        wait for the tx to be committed, the websocket event resolves it
+        immediately, the `/tx` endpoint is only polled while the websocket is
+        down, and once after it's subscribed again, in case the tx is missed.
+        """
+        txhash = txhash.upper()
+        fut = self.future(txhash)
+        self.start()
+        checked = self.live()
+        deadline = time.monotonic() + timeout
+        while True:
+            if fut.done():
+                return fut.result()
+            live = self.live()
+            if live is None or live != checked:
+                rsp = self.query(txhash)
+                if rsp is not None:
+                    self.resolve(rsp)
+                    return rsp
+                checked = live
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self.lock:
+                    if self.waiters.get(txhash) is fut:
+                        del self.waiters[txhash]
+                raise TimeoutError(f"timed out waiting for tx {txhash}")
+            try:
+                return fut.result(timeout=min(self.poll_interval, remaining))
+            except FutureTimeoutError:
+                pass
+
+
+# node rpc -> TxStream
+STREAMS = {}
+STREAMS_LOCK = threading.Lock()
+
+
+def tx_stream(rpc):
+    "the shared tx stream of the node"
+    with STREAMS_LOCK:
+        if rpc not in STREAMS:
+            STREAMS[rpc] = TxStream(rpc)
+        return STREAMS[rpc]
@@ -10,6 +10,7 @@ import secrets
 import socket
 import subprocess
 import sys
+import threading
 import time
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -40,6 +41,11 @@ from pystarport import cluster
 from web3 import AsyncWeb3
 from web3._utils.transactions import fill_nonce, fill_transaction_defaults
 
+from . import solccache
+from .blockclock import block_clock
+from .cosmosrest import SESSION
+from .timing import timed_fn
+
 load_dotenv(Path(__file__).parent.parent / "scripts/.env")
 Account.enable_unaudited_hdwallet_features()
 MNEMONICS = {
@@ -70,6 +76,11 @@ WEI_PER_ETH = 10**18  # 10^18 wei == 1 ether
 WEI_PER_DENOM = int(os.getenv("WEI_PER_DENOM", 10**12))  # 10^12 wei == 1 uom
 ADDRESS_PREFIX = os.getenv("ADDRESS_PREFIX", "mantra")
 CMD = os.getenv("CMD", "mantrachaind")
+# "rest" answers the common CosmosCLI queries with the rest gateway
+QUERY_BACKEND = os.getenv("QUERY_BACKEND", "cli")
+# reuse the `pystarport init` outputs of the same configs across runs
+INIT_CACHE_DIR = os.getenv("INIT_CACHE_DIR")
+SOLC_CACHE_DIR = os.getenv("SOLC_CACHE_DIR", "build/solc-cache")
 
 
 WETH_SALT = 999
@@ -162,6 +173,7 @@ class RevertTestContract(Contract):
         return receipt
 
 
+@timed_fn("wait")
 def wait_for_fn(name, fn, *, timeout=120, interval=1):
     for i in range(int(timeout / interval)):
         result = fn()
@@ -172,6 +184,7 @@ def wait_for_fn(name, fn, *, timeout=120, interval=1):
         raise TimeoutError(f"wait for {name} timeout")
 
 
+@timed_fn("wait")
 async def wait_for_fn_async(name, fn, *, timeout=120, interval=1):
     for i in range(int(timeout / interval)):
         result = await fn()
@@ -182,17 +195,54 @@ async def wait_for_fn_async(name, fn, *, timeout=120, interval=1):
         raise TimeoutError(f"wait for {name} timeout")
 
 
+def block_interval(cli, height, n=10, default=1.0):
+    "estimate the block interval in seconds from the recent block headers"
+    if height <= 1:
+        return default
+    try:
+        metas = SESSION.get(
+            f"{cli.node_rpc_http}/blockchain",
+            params={"minHeight": max(height - n, 1), "maxHeight": height},
+            timeout=5,
+        ).json()["result"]["block_metas"]
+    except (requests.RequestException, ValueError, KeyError):
+        return default
+    times = sorted(isoparse(meta["header"]["time"]) for meta in metas)
+    if len(times) < 2:
+        return default
+    return (times[-1] - times[0]).total_seconds() / (len(times) - 1)
+
+
+@timed_fn("wait")
 def wait_for_block_time(cli, t):
+    """
+    sleep until about one block before the target time,
+    then check the new blocks until the block time passes it.
+    """
     print("wait for block time", t)
-    while True:
+    info = get_sync_info(cli.status())
+    now = isoparse(info["latest_block_time"])
+    if now < t:
+        interval = block_interval(cli, int(info["latest_block_height"]))
+        time.sleep(max((t - now).total_seconds() - interval, 0))
+    while now < t:
+        wait_for_new_blocks(cli, 1)
         now = isoparse(get_sync_info(cli.status())["latest_block_time"])
-        print("block time now:", now)
-        if now >= t:
-            break
-        time.sleep(0.5)
 
 
+def w3_block_clock(w3):
+    return block_clock(getattr(w3.provider, "endpoint_uri", None))
+
+
+def cli_block_height(cli):
+    return int(get_sync_info(cli.status())["latest_block_height"])
+
+
+@timed_fn("wait")
 def w3_wait_for_block(w3, height, timeout=120):
+    if clock := w3_block_clock(w3):
+        clock.wait(height, lambda: w3.eth.block_number, timeout)
+        return
     for _ in range(timeout * 2):
         try:
             current_height = w3.eth.block_number
@@ -207,7 +257,15 @@ def w3_wait_for_block(w3, height, timeout=120):
         raise TimeoutError(f"wait for block {height} timeout")
 
 
+@timed_fn("wait")
 async def w3_wait_for_block_async(w3, height, timeout=120):
+    if clock := w3_block_clock(w3):
+
+        async def poll():
+            return await w3.eth.block_number
+
+        await clock.wait_async(height, poll, timeout)
+        return
     for _ in range(timeout * 2):
         try:
             current_height = await w3.eth.block_number
@@ -226,8 +284,11 @@ def get_sync_info(s):
     return s.get("SyncInfo") or s.get("sync_info")
 
 
+@timed_fn("wait")
 def wait_for_new_blocks(cli, n, sleep=0.5, timeout=120):
-    cur_height = begin_height = int(get_sync_info(cli.status())["latest_block_height"])
+    cur_height = begin_height = cli_block_height(cli)
+    if clock := block_clock(cli.node_rpc_http):
+        return clock.wait(begin_height + n, lambda: cli_block_height(cli), timeout)
     start_time = time.time()
     while cur_height - begin_height < n:
         time.sleep(sleep)
@@ -237,7 +298,11 @@ def wait_for_new_blocks(cli, n, sleep=0.5, timeout=120):
     return cur_height
 
 
+@timed_fn("wait")
 def wait_for_block(cli, height, timeout=120):
+    if clock := block_clock(cli.node_rpc_http):
+        clock.wait(height, lambda: cli_block_height(cli), timeout)
+        return
     for i in range(timeout * 2):
         try:
             status = cli.status()
@@ -253,6 +318,7 @@ def wait_for_block(cli, height, timeout=120):
         raise TimeoutError(f"wait for block {height} timeout")
 
 
+@timed_fn("wait")
 def wait_for_port(port, host="127.0.0.1", timeout=40.0):
     print("wait for port", port, "to be available")
     start_time = time.perf_counter()
@@ -269,6 +335,7 @@ def wait_for_port(port, host="127.0.0.1", timeout=40.0):
                 ) from ex
 
 
+@timed_fn("wait")
 def wait_for_url(url, timeout=40.0):
     print("wait for url", url, "to be available")
     start_time = time.perf_counter()
@@ -288,8 +355,12 @@ def wait_for_url(url, timeout=40.0):
                 ) from ex
 
 
+@timed_fn("wait")
 def w3_wait_for_new_blocks(w3, n, sleep=0.5):
     begin_height = w3.eth.block_number
+    if clock := w3_block_clock(w3):
+        clock.wait(begin_height + n, lambda: w3.eth.block_number)
+        return
     while True:
         time.sleep(sleep)
         cur_height = w3.eth.block_number
@@ -297,9 +368,17 @@ def w3_wait_for_new_blocks(w3, n, sleep=0.5):
             break
 
 
+@timed_fn("wait")
 async def w3_wait_for_new_blocks_async(w3: AsyncWeb3, n: int, sleep=0.1):
     begin_height = await w3.eth.block_number
     target = begin_height + n
+    if clock := w3_block_clock(w3):
+
+        async def poll():
+            return await w3.eth.block_number
+
+        await clock.wait_async(target, poll)
+        return
 
     while True:
         cur_height = await w3.eth.block_number
@@ -383,46 +462,69 @@ def send_txs(w3, cli, to, keys, params):
 
 # Global cache for built contracts
 CONTRACTS = {}
+# one build at a time, the concurrent callers wait for it instead of rebuilding
+BUILD_LOCK = threading.Lock()
+# the standard-json equivalent of
+# `--optimize --optimize-runs 100000 --via-ir --metadata-hash none --no-cbor-metadata`
+SOLC_SETTINGS = {
+    "optimizer": {"enabled": True, "runs": 100000},
+    "viaIR": True,
+    "metadata": {"bytecodeHash": "none", "appendCBOR": False},
+    "outputSelection": {
+        "*": {"*": ["abi", "evm.bytecode.object", "evm.deployedBytecode.object"]}
+    },
+}
 
 
+@timed_fn("solc")
 def build_contract(name, dir="contracts") -> dict:
-    if name in CONTRACTS:
+    with BUILD_LOCK:
+        if name not in CONTRACTS:
+            CONTRACTS.update(compile_contracts([name], dir))
         return CONTRACTS[name]
-    cmd = [
-        "solc",
-        "--abi",
-        "--bin",
-        "--bin-runtime",
-        f"contracts/{dir}/{name}.sol",
-        "-o",
-        "build",
-        "--overwrite",
-        "--optimize",
-        "--optimize-runs",
-        "100000",
-        "--via-ir",
-        "--metadata-hash",
-        "none",
-        "--no-cbor-metadata",
-        "--base-path",
-        "./contracts",
-        # "$(cat contracts/remappings.txt)",
-    ]
+
+
+def compile_contracts(names, dir="contracts"):
+    """
+    build the contracts `contracts/{dir}/{name}.sol` in one solc call,
+    the ones found in `SOLC_CACHE_DIR` are not compiled again.
+    """
     with open("contracts/remappings.txt", "r") as f:
         remappings = f.read().strip().split()
-
-    cmd.extend(remappings)
-    print(*cmd)
-    subprocess.run(cmd, check=True)
-    bytecode = Path(f"build/{name}.bin").read_text().strip()
-    code = Path(f"build/{name}.bin-runtime").read_text().strip()
-    result = {
-        "abi": json.loads(Path(f"build/{name}.abi").read_text()),
-        "bytecode": f"0x{bytecode}",
-        "code": f"0x{code}",
-    }
-    CONTRACTS[name] = result
-    return result
+    results = {}
+    keys = {}
+    for name in names:
+        if SOLC_CACHE_DIR:
+            source = f"contracts/{dir}/{name}.sol"
+            keys[name] = solccache.cache_key(source, SOLC_SETTINGS, remappings)
+            result = solccache.load(SOLC_CACHE_DIR, keys[name])
+            if result is not None:
+                results[name] = result
+                continue
+        results[name] = None
+    missing = [name for name, result in results.items() if result is None]
+    if not missing:
+        return results
+    units = {name: f"{dir}/{name}.sol" for name in missing}
+    settings = {**SOLC_SETTINGS, "remappings": remappings}
+    output = solccache.compile_standard(units.values(), settings, "./contracts")
+    for name, unit in units.items():
+        results[name] = solccache.artifact(output["contracts"][unit][name])
+        if SOLC_CACHE_DIR:
+            solccache.save(SOLC_CACHE_DIR, keys[name], results[name])
+    return results
+
+
+def precompile_contracts(dir="contracts"):
+    "build all the contracts of the dir, e.g. in background at session start"
+    names = sorted(path.stem for path in Path(f"contracts/{dir}").glob("*.sol"))
+    with BUILD_LOCK:
+        names = [name for name in names if name not in CONTRACTS]
+        try:
+            CONTRACTS.update(compile_contracts(names, dir))
+        except Exception as e:
+            # surfaced again by the test using the broken one
+            print(f"precompile contracts failed: {e}", file=sys.stderr)
 
 
 async def build_and_deploy_contract_async(
@@ -432,8 +534,23 @@ async def build_and_deploy_contract_async(
     key=KEYS["community"],
     exp_gas_used=None,
     dir="contracts",
+    reuse=False,
+    salt=0,
 ):
+    """
+    `reuse` deploys through create2 at the deterministic address, and returns
+    the existing instance if the code is there already, only for the tests not
+    depending on a fresh state, note the `msg.sender` of the constructor is
+    the create2 factory.
+    """
     res = build_contract(name, dir=dir)
+    if reuse:
+        acct = Account.from_key(key)
+        await ensure_create2_deployed(w3, acct)
+        address = await ensure_deployed_by_create2(
+            w3, acct, get_initcode(res, *args), salt=salt
+        )
+        return w3.eth.contract(address=address, abi=res["abi"])
     contract = w3.eth.contract(abi=res["abi"], bytecode=res["bytecode"])
     acct = Account.from_key(key)
     tx = await contract.constructor(*args).build_transaction({"from": acct.address})
@@ -545,14 +662,83 @@ def find_fee(rsp):
     return int("".join(takewhile(lambda s: s.isdigit() or s == ".", res["fee"])))
 
 
+class BalanceSnapshot(dict):
+    """
+    the balances of many addresses at a pinned height,
+    the bank balances are keyed by (address, denom),
+    the evm ones by (address, token), ZERO_ADDRESS is the native token,
+    a bare address stands for its DEFAULT_DENOM balance,
+    subtract two snapshots to get the diff.
+    """
+
+    def __init__(self, balances=(), height=None):
+        super().__init__(balances)
+        self.height = height
+
+    def __missing__(self, key):
+        if isinstance(key, str):
+            return self.get((key, DEFAULT_DENOM), 0)
+        return 0
+
+    def __sub__(self, other):
+        return BalanceSnapshot(
+            {key: self[key] - other[key] for key in self.keys() | other.keys()}
+        )
+
+    @classmethod
+    def take(
+        cls,
+        cli,
+        addrs,
+        denoms=(DEFAULT_DENOM,),
+        w3=None,
+        tokens=(),
+        height=None,
+        max_workers=16,
+    ):
+        "query all the balances concurrently, at the latest height by default"
+        if height is None:
+            height = cli.block_height()
+
+        def bank(addr):
+            bech32_addr = eth_to_bech32(addr) if addr.startswith("0x") else addr
+            coins = {
+                coin["denom"]: int(coin["amount"])
+                for coin in cli.balances(bech32_addr, height=height)
+            }
+            return {(addr, denom): coins.get(denom, 0) for denom in denoms}
+
+        def evm(addr, token):
+            eth_addr = addr if addr.startswith("0x") else bech32_to_eth(addr)
+            if token == ZERO_ADDRESS:
+                return {(addr, token): w3.eth.get_balance(eth_addr, height)}
+            fn = ERC20.fns.balanceOf(eth_addr)
+            data = w3.eth.call({"to": token, "data": fn.data}, height)
+            return {(addr, token): fn.decode(data)}
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            futs = [executor.submit(bank, addr) for addr in addrs if denoms]
+            if w3 is not None:
+                futs += [
+                    executor.submit(evm, addr, token)
+                    for addr in addrs
+                    for token in tokens
+                ]
+            balances = {}
+            for fut in as_completed(futs):
+                balances.update(fut.result())
+        return cls(balances, height)
+
+
 def assert_transfer(cli, addr_a, addr_b, amt=1):
-    balance_a = cli.balance(addr_a)
-    balance_b = cli.balance(addr_b)
+    addrs = [addr_a, addr_b]
+    before = BalanceSnapshot.take(cli, addrs)
     rsp = cli.transfer(addr_a, addr_b, f"{amt}{DEFAULT_DENOM}")
     assert rsp["code"] == 0, rsp["raw_log"]
     fee = find_fee(rsp)
-    assert cli.balance(addr_a) == balance_a - amt - fee
-    assert cli.balance(addr_b) == balance_b + amt
+    diff = BalanceSnapshot.take(cli, addrs, height=int(rsp["height"])) - before
+    assert diff[addr_a] == -amt - fee
+    assert diff[addr_b] == amt
 
 
 def denom_to_erc20_address(denom):
@@ -780,6 +966,23 @@ def build_batch_tx(w3, cli, txs, key=KEYS["community"]):
     }, tx_hashes
 
 
+def vote_proposal(n, proposal_id, option="yes", **kwargs):
+    "vote with the validators of all nodes in threads, callable from coroutines"
+    count = len(n.config["validators"])
+    with ThreadPoolExecutor(max_workers=min(count, 8)) as executor:
+        rsps = list(
+            executor.map(
+                lambda i: n.cosmos_cli(i).gov_vote(
+                    "validator", proposal_id, option, **kwargs
+                ),
+                range(count),
+            )
+        )
+    for rsp in rsps:
+        assert rsp["code"] == 0, rsp["raw_log"]
+    return rsps
+
+
 def approve_proposal(n, events, event_query_tx=True, **kwargs):
     cli = n.cosmos_cli()
     # get proposal_id
@@ -787,15 +990,7 @@ def approve_proposal(n, events, event_query_tx=True, **kwargs):
         events, "submit_proposal", lambda attrs: "proposal_id" in attrs
     )
     proposal_id = ev["proposal_id"]
-    for i in range(len(n.config["validators"])):
-        rsp = n.cosmos_cli(i).gov_vote(
-            "validator",
-            proposal_id,
-            "yes",
-            event_query_tx=event_query_tx,
-            **kwargs,
-        )
-        assert rsp["code"] == 0, rsp["raw_log"]
+    vote_proposal(n, proposal_id, event_query_tx=event_query_tx, **kwargs)
     wait_for_new_blocks(cli, 1)
     res = cli.query_tally(proposal_id)
     res = res.get("tally") or res